@@ -0,0 +1,108 @@
+"""Stand-in for habitica.api.HabiticaAPI that answers from memory, so benchmarks measure the client rather than the network"""
+
+import copy
+import datetime
+import random
+
+
+task_types = ("habit", "daily", "todo", "reward")
+words = (
+	"water", "plants", "walk", "dog", "read", "book", "write", "report", "call", "mom",
+	"clean", "kitchen", "gym", "stretch", "email", "inbox", "review", "pull", "request", "groceries",
+	"laundry", "meditate", "practice", "piano", "study", "spanish", "budget", "taxes", "dentist", "journal",
+)
+
+
+def generate_tasks(count, seed=0):
+	"""A believable mix of count tasks as the API would return them, the same every time for a given seed"""
+	rng = random.Random(seed)
+	tags = [f"tag-{index}" for index in range(10)]
+	now = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+	task_list = []
+	for index in range(count):
+		type = rng.choices(task_types, weights=(2, 3, 8, 1))[0]
+		task_id = f"{index:08x}-0000-4000-8000-{rng.getrandbits(48):012x}"
+		updated = now + datetime.timedelta(minutes=index)
+		task = {
+			"_id": task_id,
+			"id": task_id,
+			"type": type,
+			"text": " ".join(rng.sample(words, rng.randint(2, 5))).capitalize(),
+			"notes": " ".join(rng.sample(words, rng.randint(0, 8))),
+			"tags": rng.sample(tags, rng.randint(0, 2)),
+			"value": round(rng.uniform(-5, 5), 2),
+			"priority": rng.choice((0.1, 1, 1.5, 2)),
+			"createdAt": now.isoformat(),
+			"updatedAt": updated.isoformat(),
+		}
+		if type == "habit":
+			task.update(up=True, down=rng.random() < 0.5, counterUp=0, counterDown=0)
+		elif type == "daily":
+			task.update(completed=False, frequency="weekly", everyX=1, nextDue=[(now + datetime.timedelta(days=1)).isoformat()])
+		elif type == "todo":
+			task.update(completed=False)
+			if rng.random() < 0.3:
+				task["date"] = (now + datetime.timedelta(days=rng.randint(0, 30))).isoformat()
+		else:
+			task["value"] = rng.randint(1, 50)
+		if type in ("daily", "todo"):
+			task["checklist"] = [{"id": f"{task_id}-{item}", "text": " ".join(rng.sample(words, 2)), "completed": False} for item in range(rng.randint(0, 3))]
+		task_list.append(task)
+	return task_list
+
+
+class FakeUser:
+	def __init__(self, tags=()):
+		self.needsCron = False
+		self.stats = {"hp": 50, "mp": 10, "exp": 0, "gp": 0, "lvl": 1}
+		self.tags = [{"id": tag, "name": f"Tag {tag}"} for tag in tags]
+
+	def diff_stats(self, stats):
+		return {}
+
+	def to_dict(self):
+		return {"needsCron": self.needsCron, "stats": dict(self.stats), "tags": list(self.tags)}
+
+
+class FakeAPI:
+	"""Implements the handful of HabiticaAPI methods the client calls, over a list of task dicts"""
+
+	def __init__(self, task_list):
+		self.tasks = {task["_id"]: task for task in task_list}
+		self.user = FakeUser(sorted({tag for task in task_list for tag in task["tags"]}))
+		self.cached_user = self.user
+		self._cached_user = self.user
+
+	def login(self, username, password):
+		return {"success": True}
+
+	def get_user(self):
+		return self.user
+
+	def get_tasks_for_user(self, task_type=None):
+		return {"success": True, "data": [copy.deepcopy(task) for task in self.tasks.values()]}
+
+	def score_task(self, task_id, direction="up"):
+		task = self.tasks.get(task_id)
+		if not task:
+			return {"success": False, "error": "NotFound"}
+		if task["type"] in ("daily", "todo"):
+			task["completed"] = direction == "up"
+		return {"success": True, "data": {"delta": 1.0 if direction == "up" else -1.0, "_tmp": {}}}
+
+	def cron(self):
+		return {"success": True, "data": {}}
+
+	def create_task(self, type, text, **fields):
+		task_id = f"new-{len(self.tasks)}"
+		task = dict(fields, _id=task_id, id=task_id, type=type, text=text)
+		self.tasks = {task_id: task, **self.tasks}
+		return {"success": True, "data": task}
+
+	def update_task(self, task_id, **fields):
+		self.tasks[task_id].update(fields)
+		return {"success": True, "data": self.tasks[task_id]}
+
+	def delete_task(self, task_id):
+		self.tasks.pop(task_id, None)
+		return {"success": True, "data": {}}
@@ -0,0 +1,204 @@
+"""Local stand-in for the Habitica v3 API, for load testing the client on one machine.
+
+Serves the login, user, task, score and cron endpoints over generated tasks, with configurable latency, jitter, server errors and rate limiting.
+Point the client at it by setting api_url in config.ini to the address printed on startup.
+
+usage:
+	python benchmarks/fake_server.py [--port 8000] [--tasks 1000] [--latency 50] [--jitter 20] [--error-rate 0.05] [--rate-limit 30]
+"""
+
+import argparse
+import http.server
+import json
+import random
+import re
+import threading
+import time
+
+import fake_api
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+	# (method, path pattern, handler), paths are matched with or without the /api/v3 prefix
+	routes = (
+		("POST", r"/user/auth/local/login", "login"),
+		("GET", r"/user", "get_user"),
+		("GET", r"/tasks/user", "get_tasks"),
+		("POST", r"/tasks/user", "create_task"),
+		("POST", r"/tasks/([^/]+)/score/(up|down)", "score_task"),
+		("PUT", r"/tasks/([^/]+)", "update_task"),
+		("DELETE", r"/tasks/([^/]+)", "delete_task"),
+		("POST", r"/cron", "cron"),
+	)
+
+	def do_GET(self):
+		self.dispatch("GET")
+
+	def do_POST(self):
+		self.dispatch("POST")
+
+	def do_PUT(self):
+		self.dispatch("PUT")
+
+	def do_DELETE(self):
+		self.dispatch("DELETE")
+
+	def dispatch(self, method):
+		server = self.server
+		server.delay()
+		remaining, reset = server.take_request()
+		headers = {}
+		if server.rate_limit:
+			headers = {"X-RateLimit-Limit": str(server.rate_limit), "X-RateLimit-Remaining": str(max(remaining, 0)), "X-RateLimit-Reset": str(reset)}
+		if remaining < 0:
+			headers["Retry-After"] = str(max(int(reset - time.time()), 1))
+			return self.reply(429, {"success": False, "error": "TooManyRequests", "message": "Rate limit exceeded"}, headers)
+		if server.should_fail():
+			status = server.rng.choice((500, 502, 503))
+			return self.reply(status, {"success": False, "error": "InternalServerError", "message": "Injected failure"}, headers)
+		path = self.path.split("?")[0]
+		if path.startswith("/api/v3"):
+			path = path[len("/api/v3"):]
+		for route_method, pattern, name in self.routes:
+			match = re.fullmatch(pattern, path)
+			if route_method == method and match:
+				body = self.read_body()
+				with server.lock:
+					data = getattr(self, name)(body, *match.groups())
+				status = 200 if data.get("success", True) else 404
+				return self.reply(status, data, headers)
+		self.reply(404, {"success": False, "error": "NotFound", "message": f"No route for {method} {path}"}, headers)
+
+	def read_body(self):
+		length = int(self.headers.get("Content-Length") or 0)
+		if not length:
+			return {}
+		try:
+			return json.loads(self.rfile.read(length))
+		except ValueError:
+			return {}
+
+	def reply(self, status, data, headers=None):
+		body = json.dumps(data).encode("UTF8")
+		self.send_response(status)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(body)))
+		for name, value in (headers or {}).items():
+			self.send_header(name, value)
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, format, *args):
+		if self.server.verbose:
+			super().log_message(format, *args)
+
+	def login(self, body):
+		return {"success": True, "data": {"id": "fake-user", "apiToken": "fake-token", "username": body.get("username", "")}}
+
+	def get_user(self, body):
+		return {"success": True, "data": self.server.api.user.to_dict()}
+
+	def get_tasks(self, body):
+		return self.server.api.get_tasks_for_user()
+
+	def create_task(self, body):
+		fields = dict(body)
+		return self.server.api.create_task(fields.pop("type", "todo"), fields.pop("text", ""), **fields)
+
+	def score_task(self, body, task_id, direction):
+		return self.server.api.score_task(task_id, direction)
+
+	def update_task(self, body, task_id):
+		if task_id not in self.server.api.tasks:
+			return {"success": False, "error": "NotFound"}
+		return self.server.api.update_task(task_id, **body)
+
+	def delete_task(self, body, task_id):
+		return self.server.api.delete_task(task_id)
+
+	def cron(self, body):
+		return self.server.api.cron()
+
+
+class FakeHabitica(http.server.ThreadingHTTPServer):
+	daemon_threads = True
+
+	def __init__(self, address=("127.0.0.1", 0), task_count=1000, latency=0, jitter=0, error_rate=0, rate_limit=0, seed=0, verbose=False):
+		"""args:
+			address (tuple): (host, port) to listen on, port 0 picks a free one.
+			task_count (int): Size of the generated account.
+			latency (float): Milliseconds every request takes before being answered.
+			jitter (float): Up to this many milliseconds are randomly added to or taken from latency.
+			error_rate (float): Fraction of requests answered with a 5xx error.
+			rate_limit (int): Requests allowed per minute before answering 429, like the real server does. 0 for no limit.
+		"""
+		super().__init__(address, Handler)
+		self.api = fake_api.FakeAPI(fake_api.generate_tasks(task_count, seed))
+		self.latency = latency
+		self.jitter = jitter
+		self.error_rate = error_rate
+		self.rate_limit = rate_limit
+		self.verbose = verbose
+		self.rng = random.Random(seed)
+		self.lock = threading.Lock()
+		self.window_start = time.time()
+		self.window_requests = 0
+
+	@property
+	def url(self):
+		host, port = self.server_address[:2]
+		return f"http://{host}:{port}"
+
+	def delay(self):
+		with self.lock:
+			delay = self.latency + self.rng.uniform(-self.jitter, self.jitter)
+		if delay > 0:
+			time.sleep(delay / 1000)
+
+	def should_fail(self):
+		with self.lock:
+			return self.rng.random() < self.error_rate
+
+	def take_request(self):
+		"""Count a request against the current one minute window, returning (requests left, when the window resets). Left is negative once over the limit"""
+		with self.lock:
+			now = time.time()
+			if now - self.window_start >= 60:
+				self.window_start = now
+				self.window_requests = 0
+			self.window_requests += 1
+			reset = int(self.window_start + 60)
+			if not self.rate_limit:
+				return 1, reset
+			return self.rate_limit - self.window_requests, reset
+
+	def start(self):
+		"""Serve on a daemon thread, for use from benchmarks"""
+		thread = threading.Thread(target=self.serve_forever, name="fake-habitica", daemon=True)
+		thread.start()
+		return thread
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument("--host", default="127.0.0.1")
+	parser.add_argument("--port", type=int, default=8000)
+	parser.add_argument("--tasks", type=int, default=1000, help="Number of generated tasks")
+	parser.add_argument("--latency", type=float, default=0, help="Milliseconds added to every request")
+	parser.add_argument("--jitter", type=float, default=0, help="Random variation of latency in milliseconds")
+	parser.add_argument("--error-rate", type=float, default=0, help="Fraction of requests that fail with a 5xx")
+	parser.add_argument("--rate-limit", type=int, default=0, help="Requests per minute before answering 429, 0 for none")
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--verbose", action="store_true", help="Log every request")
+	args = parser.parse_args()
+	server = FakeHabitica((args.host, args.port), args.tasks, args.latency, args.jitter, args.error_rate, args.rate_limit, args.seed, args.verbose)
+	print(f"Serving {args.tasks} tasks at {server.url}")
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	server.server_close()
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,207 @@
+"""Time the parts of the client whose cost grows with the number of tasks.
+
+Every benchmark runs against generated accounts of each size, with the API answered from memory by fake_api, and the results are written as JSON so two runs can be compared.
+
+usage:
+	python benchmarks/run.py [--sizes 10,1000,10000] [--repeat 5] [--output results.json] [--compare baseline.json]
+
+With --server the real HabiticaAPI is used instead, talking HTTP to fake_server with the given latency, jitter, error rate and rate limit.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+import fake_api
+import fake_server
+
+
+default_sizes = (10, 1000, 10000)
+# a result counts as a regression when it's slower than the baseline by more than this
+tolerance = 0.1
+
+
+def measure(func, repeat, setup=None, teardown=None):
+	"""Call func repeat times and summarize how long it took in milliseconds.
+
+	args:
+		setup (callable): Called before every run, outside the timing. Whatever it returns is passed to func.
+		teardown (callable): Called after every run with whatever func returned, outside the timing.
+	"""
+	runs = []
+	for _ in range(repeat):
+		args = setup() if setup else ()
+		started = time.perf_counter()
+		result = func(*args)
+		runs.append((time.perf_counter() - started) * 1000)
+		if teardown:
+			teardown(result)
+	return {
+		"median_ms": round(statistics.median(runs), 3),
+		"min_ms": round(min(runs), 3),
+		"max_ms": round(max(runs), 3),
+		"runs": repeat,
+	}
+
+
+def setup_client(data_dir):
+	"""Point the client at a scratch data directory and create the wx app, before anything reads either"""
+	from ui import app
+	app.data_dir = data_dir
+	app.config_path = os.path.join(data_dir, "config.ini")
+	from ui import config
+	config.load(app.config_path, quiet=True)
+	config.config["api_user"] = "benchmark"
+	import wx
+	app.app = wx.App()
+	from ui import action_journal
+	from ui import habitica_functions as habitica
+	from ui import request_scheduler
+	from ui import sound_cache
+	# importing ui already created these under the real data directory, keep the users own journal and sounds out of it
+	habitica.journal = action_journal.ActionJournal(os.path.join(data_dir, action_journal.filename), owner=config.config["api_user"])
+	habitica.sounds = sound_cache.SoundCache(os.path.join(data_dir, "sounds"))
+	# the real rate limit would turn the score benchmark into a measurement of our own throttling
+	habitica.client.scheduler = request_scheduler.RequestScheduler(rate=10000, capacity=10000)
+	# no audio device needed
+	habitica.play_sound = lambda sound_name: None
+	return habitica
+
+
+def run_size(habitica, count, repeat, server=None):
+	import wx
+	from ui import config
+	from ui import task_cache
+	from ui import tasks
+	from ui import ui as views
+	task_list = fake_api.generate_tasks(count)
+	if server:
+		server.api = fake_api.FakeAPI(task_list)
+	else:
+		habitica.api = fake_api.FakeAPI(task_list)
+	results = {}
+
+	def fresh_store():
+		habitica.store = tasks.TaskStore()
+		return ()
+
+	# download and merge everything into an empty store, then again with nothing changed
+	results["refresh_cold"] = measure(lambda: habitica.refresh_tasks(None, update_ui=False), repeat, setup=fresh_store)
+	results["refresh_unchanged"] = measure(lambda: habitica.refresh_tasks(None, update_ui=False), repeat)
+	results["group_tasks"] = measure(lambda: habitica.group_tasks(habitica.store.all()), repeat)
+	results["search"] = measure(lambda: habitica.store.search("wa"), repeat)
+	groups = habitica.group_tasks(habitica.store.all())
+	empty = {group: [] for group in groups}
+
+	for view in ("tree", "list"):
+		config.config["task_view"] = view
+		frame = views.TaskTreeFrame(cached_tasks=[], refresh=False)
+		panel = frame.tasks_panel
+		results[f"{view}_populate"] = measure(lambda: panel.update_task_types(**groups), repeat, setup=lambda: panel.update_task_types(**empty))
+		results[f"{view}_update_unchanged"] = measure(lambda: panel.update_task_types(**groups), repeat)
+		frame.Destroy()
+	config.config["task_view"] = "tree"
+
+	# journal, apply locally, send and confirm, one task at a time
+	todos = iter(habitica.store.incomplete("todo") or habitica.store.all())
+	results["score_task"] = measure(lambda task: habitica.score_task(None, task, update_ui=False).result(), min(repeat, count), setup=lambda: (next(todos),))
+
+	# from reading the on-disk cache to the tree being drawn
+	task_cache.save(task_list, owner="benchmark")
+	def first_paint():
+		frame = views.TaskTreeFrame(cached_tasks=habitica.load_cached_tasks(), refresh=False)
+		frame.Show()
+		frame.Update()
+		wx.SafeYield()
+		return frame
+	results["first_paint"] = measure(first_paint, repeat, teardown=lambda frame: frame.Destroy())
+	return results
+
+
+def compare(baseline, current):
+	"""Print how each result moved relative to baseline, returning whether anything got slower than tolerance allows"""
+	regressed = False
+	for size, results in current["results"].items():
+		for name, result in results.items():
+			old = baseline["results"].get(size, {}).get(name)
+			if not old or not old["median_ms"]:
+				continue
+			change = result["median_ms"] / old["median_ms"] - 1
+			flag = ""
+			if change > tolerance:
+				flag = "  <-- slower"
+				regressed = True
+			print(f"{size:>6} {name:<24} {old['median_ms']:>10.2f} -> {result['median_ms']:>10.2f} ms ({change:+.0%}){flag}")
+	return regressed
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument("--sizes", default=",".join(str(size) for size in default_sizes), help="Comma separated task counts")
+	parser.add_argument("--repeat", type=int, default=5, help="Runs of each benchmark, the median is reported")
+	parser.add_argument("--output", help="Where to write the results, benchmarks/results/<time>.json by default")
+	parser.add_argument("--compare", help="Results of an earlier run to compare against")
+	parser.add_argument("--server", action="store_true", help="Go through HTTP and a local fake_server instead of calling into memory")
+	parser.add_argument("--latency", type=float, default=0, help="With --server, milliseconds added to every request")
+	parser.add_argument("--jitter", type=float, default=0, help="With --server, random variation of latency in milliseconds")
+	parser.add_argument("--error-rate", type=float, default=0, help="With --server, fraction of requests that fail with a 5xx")
+	parser.add_argument("--rate-limit", type=int, default=0, help="With --server, requests per minute before answering 429")
+	args = parser.parse_args()
+	sizes = [int(size) for size in args.sizes.split(",") if size]
+	server = None
+	if args.server:
+		server = fake_server.FakeHabitica(task_count=0, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, rate_limit=args.rate_limit)
+		server.start()
+	with tempfile.TemporaryDirectory() as data_dir:
+		habitica = setup_client(data_dir)
+		if server:
+			from ui import config
+			from ui import request_scheduler
+			config.config["api_url"] = server.url
+			habitica.init_api()
+			if args.rate_limit:
+				# let the client throttle itself like it would against the real thing
+				habitica.client.scheduler = request_scheduler.RequestScheduler()
+		results = {}
+		for count in sizes:
+			print(f"Running with {count} tasks")
+			results[str(count)] = run_size(habitica, count, args.repeat, server)
+		habitica.client.close()
+	if server:
+		server.shutdown()
+		server.server_close()
+	report = {
+		"time": datetime.datetime.now().isoformat(timespec="seconds"),
+		"python": platform.python_version(),
+		"platform": platform.platform(),
+		"repeat": args.repeat,
+		"server": {"latency": args.latency, "jitter": args.jitter, "error_rate": args.error_rate, "rate_limit": args.rate_limit} if server else None,
+		"results": results,
+	}
+	output = args.output or os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", time.strftime("%Y%m%d-%H%M%S") + ".json")
+	os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+	with open(output, "w", encoding="UTF8") as f:
+		json.dump(report, f, indent=2)
+	print(f"Results written to {output}")
+	if args.compare:
+		with open(args.compare, "r", encoding="UTF8") as f:
+			baseline = json.load(f)
+		if compare(baseline, report):
+			sys.exit(1)
+	else:
+		for size, size_results in results.items():
+			for name, result in size_results.items():
+				print(f"{size:>6} {name:<24} {result['median_ms']:>10.2f} ms")
+
+
+if __name__ == "__main__":
+	main()
@@ -1,7 +1,11 @@
-from habitica import HabiticaAPI
+import time
+launched = time.perf_counter()
+
 import ui
 from ui import app
 
 
+app.mark("launch", launched)
+app.mark("imports")
 app.init()
 ui.start()
@@ -0,0 +1,142 @@
+"""Durable, append-only record of actions the server hasn't confirmed yet"""
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+
+log = logging.getLogger("action_journal")
+filename = "actions.jsonl"
+
+
+class ActionJournal:
+	"""Write-ahead log of task actions (score, create, update, delete).
+
+	Every action is written here before it is sent, under a unique key, and marked done once the server confirmed or rejected it.
+	Whatever isn't marked done when the app closes is replayed, in order, on the next run. Done keys are never replayed.
+	An action only stays pending when it couldn't reach the server at all. If the request went out but the answer never came (a timeout or a dropped connection), the server may have acted on it anyway, so scores and creates are marked done as ambiguous instead of being sent again, and the next download shows what really happened. Updates and deletes stay pending, repeating them does no harm.
+	Actions are recorded along with the account they were made on, and only those of the current owner are ever pending, so switching accounts never replays somebody elses changes.
+	"""
+
+	def __init__(self, path, owner=None):
+		self.path = path
+		# API user of the account actions are recorded for and replayed to, see set_owner
+		self.owner = owner
+		self.lock = threading.Lock()
+		self.actions = []
+		self.done_keys = set()
+		# ids of tasks created while offline -> the id the server gave them
+		self.id_map = {}
+		self.load()
+
+	def load(self):
+		try:
+			with open(self.path, "r", encoding="UTF8") as f:
+				lines = f.readlines()
+		except FileNotFoundError:
+			return
+		except OSError:
+			log.exception("While reading the action journal")
+			return
+		for line in lines:
+			try:
+				entry = json.loads(line)
+			except ValueError:
+				# most likely the last line, cut short by a crash mid write
+				log.warning("Skipping a damaged action journal entry")
+				continue
+			self.apply_entry(entry)
+
+	def set_owner(self, owner):
+		"""Switch to the account with the given API user, e.g. after logging in"""
+		with self.lock:
+			self.owner = owner
+
+	def apply_entry(self, entry):
+		if entry.get("type") == "action":
+			self.actions.append(entry)
+		elif entry.get("type") == "done":
+			self.done_keys.add(entry["key"])
+			if entry.get("local_id") and entry.get("id"):
+				self.id_map[entry["local_id"]] = entry["id"]
+
+	def write(self, entry):
+		# must hold self.lock
+		os.makedirs(os.path.dirname(self.path), exist_ok=True)
+		with open(self.path, "a", encoding="UTF8") as f:
+			f.write(json.dumps(entry) + "\n")
+			f.flush()
+			os.fsync(f.fileno())
+		self.apply_entry(entry)
+
+	@staticmethod
+	def new_key():
+		return uuid.uuid4().hex
+
+	def append(self, op, args, key=None):
+		"""Record an action before it is sent. Returns the entry"""
+		with self.lock:
+			entry = {"type": "action", "key": key or self.new_key(), "owner": self.owner, "op": op, "args": args, "time": time.time()}
+			self.write(entry)
+		return entry
+
+	def done(self, key, local_id=None, id=None, ambiguous=False):
+		"""Mark an action as settled, either way.
+
+		args:
+			local_id, id (str): For creates, the placeholder id used locally and the id the server assigned.
+			ambiguous (bool): Whether it's unknown if the server acted on it, recorded for troubleshooting.
+		"""
+		entry = {"type": "done", "key": key}
+		if local_id and id:
+			entry.update(local_id=local_id, id=id)
+		if ambiguous:
+			entry["ambiguous"] = True
+		with self.lock:
+			self.write(entry)
+
+	def pending(self):
+		"""Actions of the current owner not yet marked done, oldest first"""
+		with self.lock:
+			return self.unsettled(self.owner)
+
+	def unsettled(self, owner):
+		# must hold self.lock. Entries written before owners were recorded belong to nobody and are never replayed
+		return [action for action in self.actions if action["key"] not in self.done_keys and action.get("owner") == owner]
+
+	def resolve(self, task_id):
+		"""The server id for task_id, which may be the placeholder of a task created while offline"""
+		with self.lock:
+			return self.id_map.get(task_id, task_id)
+
+	def compact(self):
+		"""Drop everything settled from disk. Only does anything once nothing is pending for the current owner anymore.
+
+		Actions still waiting for other accounts are kept, to be sent when they log in again.
+		"""
+		with self.lock:
+			if self.unsettled(self.owner):
+				return False
+			kept = [action for action in self.actions if action["key"] not in self.done_keys and action.get("owner") is not None]
+			try:
+				if kept:
+					tmp_path = self.path + ".tmp"
+					with open(tmp_path, "w", encoding="UTF8") as f:
+						f.writelines(json.dumps(action) + "\n" for action in kept)
+						f.flush()
+						os.fsync(f.fileno())
+					os.replace(tmp_path, self.path)
+				else:
+					os.remove(self.path)
+			except FileNotFoundError:
+				pass
+			except OSError:
+				log.exception("While compacting the action journal")
+				return False
+			self.actions = kept
+			self.done_keys = set()
+			self.id_map = {}
+			return True
@@ -1,9 +1,15 @@
+import logging
+import logging.handlers
 import os
 import sys
+import time
 import appdirs
 import wx
 
 from ui import config
+from ui import trace
+from ui import watchdog
+from ui import workers
 
 
 name = "Habitica Task Viewer"
@@ -11,8 +17,18 @@ version = "0.1 Beta"
 author="Carter Temm <cartertemm@gmail.com>"
 data_dir = appdirs.user_data_dir("Habitica", roaming=True)
 config_path = os.path.join(data_dir, "config.ini")
+log_path = os.path.join(data_dir, "log.txt")
 debug = False
+profile_startup = False
 app = None
+# logs UI freezes, see watchdog.Watchdog. Off unless configured or running with --debug, it wakes the UI thread ten times a second
+stall_watchdog = None
+debug_stall_threshold = 0.5
+# log.txt is rotated once it reaches this size, keeping log_backups old ones
+max_log_bytes = 1024 * 1024
+log_backups = 2
+# (phase, time it ended) pairs, reported when running with --profile-startup
+startup_marks = []
 
 
 def from_source():
@@ -20,19 +36,63 @@ def from_source():
 
 def init():
 	"""Non UI-critical app initialization"""
-	global app, debug
+	global app, debug, profile_startup, stall_watchdog
 	args = sys.argv[1:]
 	if "--debug" in args:
 		debug = True
 		print("Running with debug flag")
+		trace.enable()
+	if "--profile-startup" in args:
+		profile_startup = True
 	if not os.path.isdir(data_dir):
 		if debug:
 			print("Creating configuration directory")
 		os.makedirs(data_dir)
+	handlers = [logging.handlers.RotatingFileHandler(log_path, maxBytes=max_log_bytes, backupCount=log_backups, encoding="UTF8")]
+	if debug:
+		handlers.append(logging.StreamHandler())
+	logging.basicConfig(level=logging.DEBUG if debug else logging.WARNING, format="%(asctime)s %(name)s %(levelname)s: %(message)s", handlers=handlers)
 	config.load(config_path)
 	app = wx.App()
+	threshold = config.config.get("stall_threshold") or (debug_stall_threshold if debug else 0)
+	if threshold:
+		stall_watchdog = watchdog.Watchdog(threshold)
+		stall_watchdog.start()
+	mark("init")
+
+def mark(phase, when=None):
+	"""Record that a startup phase ended now, or at when (a time.perf_counter value)"""
+	startup_marks.append((phase, time.perf_counter() if when is None else when))
+
+def report_startup():
+	"""Print how long each startup phase took, if running with --profile-startup"""
+	if not profile_startup or len(startup_marks) < 2:
+		return
+	print("Startup profile:")
+	for (_, started), (phase, ended) in zip(startup_marks, startup_marks[1:]):
+		print(f"  {phase}: {(ended - started) * 1000:.1f} ms")
+	print(f"  total: {(startup_marks[-1][1] - startup_marks[0][1]) * 1000:.1f} ms")
+
+def write_trace():
+	"""Save the trace collected while running with --debug, returning where it went"""
+	if not trace.enabled:
+		return
+	path = os.path.join(data_dir, "trace.json")
+	try:
+		trace.write(path)
+	except OSError:
+		print(f"Could not write the trace to {path}")
+		return
+	print(f"Trace written to {path}")
+	return path
 
 def exit():
+	from ui import habitica_functions
+	if stall_watchdog:
+		stall_watchdog.stop()
+	write_trace()
+	habitica_functions.client.close()
+	workers.pool.shutdown(wait=False, cancel_futures=True)
 	if app:
 		app.ExitMainLoop()
 	sys.exit()
@@ -0,0 +1,102 @@
+"""asyncio facade over the blocking habitica API"""
+
+import asyncio
+import concurrent.futures
+import functools
+import logging
+import threading
+
+from ui import request_scheduler
+from ui import trace
+
+
+log = logging.getLogger("client")
+
+
+class AsyncClient:
+	"""Runs API calls from a single asyncio event loop living on a background thread.
+
+	The HabiticaAPI methods themselves block, so each call is handed to a small executor and awaited. That gives us concurrent fan out, timeouts and cancellation, while every request still goes through the one shared api object and its keep-alive session.
+	Every call is throttled and retried by a request_scheduler.RequestScheduler.
+	Nothing in here touches wx, results reach the UI through utils.call_in_ui.
+	"""
+	# calls that are safe to repeat when the server fails part way through
+	idempotent_methods = {"get_user", "get_tasks_for_user", "update_task"}
+
+	def __init__(self, get_api, max_connections=6, timeout=30):
+		"""args:
+			get_api (callable): Returns the HabiticaAPI instance to call into, looked up on every call since it's created at login.
+			max_connections (int): Upper bound on requests in flight at once.
+			timeout (float): Default number of seconds before a call is abandoned.
+		"""
+		self.get_api = get_api
+		self.max_connections = max_connections
+		self.timeout = timeout
+		self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_connections, thread_name_prefix="api")
+		self.scheduler = request_scheduler.RequestScheduler()
+		self.loop = None
+		self.thread = None
+		self.lock = threading.Lock()
+
+	def start(self):
+		"""Start the event loop thread, if it isn't running yet"""
+		with self.lock:
+			if self.loop:
+				return self.loop
+			self.loop = asyncio.new_event_loop()
+			self.thread = threading.Thread(target=self.loop.run_forever, name="client-loop", daemon=True)
+			self.thread.start()
+			return self.loop
+
+	def close(self):
+		with self.lock:
+			if not self.loop:
+				return
+			self.loop.call_soon_threadsafe(self.loop.stop)
+			self.loop = None
+			self.thread = None
+		self.executor.shutdown(wait=False, cancel_futures=True)
+
+	async def call(self, method, args=(), kwargs=None, timeout=None, priority=request_scheduler.user_priority):
+		"""Await api.method(*args, **kwargs).
+
+		A single attempt exceeding timeout raises requests.exceptions.Timeout, just like a timeout inside requests would.
+
+		args:
+			priority (int): request_scheduler.user_priority for anything the user is waiting on, request_scheduler.background_priority otherwise.
+		"""
+		import requests
+		func = functools.partial(getattr(self.get_api(), method), *args, **(kwargs or {}))
+		func = trace.wrap(func, f"api {method}", "api")
+		timeout = timeout or self.timeout
+		async def attempt():
+			try:
+				return await asyncio.wait_for(asyncio.get_running_loop().run_in_executor(self.executor, func), timeout)
+			except asyncio.TimeoutError:
+				raise requests.exceptions.Timeout(f"{method} took longer than {timeout} seconds") from None
+		return await self.scheduler.run(attempt, priority=priority, idempotent=method in self.idempotent_methods)
+
+	async def gather(self, *calls, limit=None):
+		"""Await several calls concurrently, at most limit at a time.
+
+		returns:
+			A list of results in the order given, with exceptions in place of the calls that raised one.
+		"""
+		if limit:
+			semaphore = asyncio.Semaphore(limit)
+			async def limited(call):
+				async with semaphore:
+					return await call
+			calls = [limited(call) for call in calls]
+		return await asyncio.gather(*calls, return_exceptions=True)
+
+	def submit(self, coro):
+		"""Schedule a coroutine on the loop from any thread, returning a concurrent.futures.Future.
+
+		Cancelling the future cancels the coroutine.
+		"""
+		return asyncio.run_coroutine_threadsafe(coro, self.start())
+
+	def run(self, method, args=(), kwargs=None, **options):
+		"""Call api.method on the loop and block until it's done, options being those of call. Must not be called from the loop thread"""
+		return self.submit(self.call(method, args, kwargs, **options)).result()
@@ -4,4 +4,10 @@ from io import StringIO
 configspec = StringIO("""username = string(default="")
 api_user = string(default="")
 api_key = string(default="")
+# server to talk to instead of habitica.com, e.g. the one started by benchmarks/fake_server.py
+api_url = string(default="")
+# "list" shows every task in a flat virtual list, which scales better to thousands of tasks
+task_view = option("tree", "list", default="tree")
+# seconds the UI may go without processing events before the stack is logged. 0 leaves the watchdog off, except with --debug where it watches for half a second
+stall_threshold = float(min=0, default=0)
 """)
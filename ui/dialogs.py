@@ -1,35 +1,68 @@
-import wx
+import concurrent.futures
+import logging
 import threading
 
-def dialog(parent, caption, message, style=0, *args, **kwargs):
+import wx
+
+
+log = logging.getLogger("dialogs")
+
+
+def show(parent, caption, message, style=0, callback=None, **kwargs):
+	"""Show a message dialog without waiting for the user, from any thread.
+
+	The dialog is always created and shown on the UI thread, which owns it from start to finish. Whoever asked carries on right away.
+
+	args:
+		callback (callable): Run on the UI thread with the result of ShowModal (e.g. wx.ID_YES) once the dialog is closed.
+	returns:
+		A concurrent.futures.Future for the result of ShowModal. Don't wait on it from the UI thread, that would never finish.
+	"""
 	style |= wx.CENTRE
-	dlg = wx.MessageDialog(parent, message, caption, style, **kwargs)
-	# hack: ensure UI events are always confined to the main thread
-	evt = threading.Event()
+	future = concurrent.futures.Future()
 	def inner():
+		if not future.set_running_or_notify_cancel():
+			return
+		dlg = wx.MessageDialog(parent, message, caption, style, **kwargs)
 		try:
-			inner.response = dlg.ShowModal()
+			response = dlg.ShowModal()
+		except Exception as exc:
+			log.exception(f"While showing {caption}")
+			future.set_exception(exc)
+			return
 		finally:
-			evt.set()
 			dlg.Destroy()
-	if threading.current_thread() != threading.main_thread():
-		print("running from another thread")
-		wx.CallAfter(inner)
-	else:
-		inner()
-	evt.wait()
-	return inner.response
+		future.set_result(response)
+		if callback:
+			callback(response)
+	wx.CallAfter(inner)
+	return future
+
+def dialog(parent, caption, message, style=0, callback=None, **kwargs):
+	"""Show a message dialog.
+
+	On the UI thread without a callback this blocks until the dialog is closed and returns the result of ShowModal, like ShowModal itself.
+	Otherwise it's handed to show, and a Future is returned instead, so background threads are never held up by the user.
+	"""
+	if callback or threading.current_thread() != threading.main_thread():
+		return show(parent, caption, message, style, callback=callback, **kwargs)
+	style |= wx.CENTRE
+	dlg = wx.MessageDialog(parent, message, caption, style, **kwargs)
+	try:
+		return dlg.ShowModal()
+	finally:
+		dlg.Destroy()
 
-def information(parent, caption, message):
-	return dialog(parent, caption, message, style=wx.OK|wx.ICON_INFORMATION)
+def information(parent, caption, message, callback=None):
+	return dialog(parent, caption, message, style=wx.OK|wx.ICON_INFORMATION, callback=callback)
 
-def error(parent, caption, message):
-	return dialog(parent, caption, message, style=wx.OK|wx.ICON_ERROR)
+def error(parent, caption, message, callback=None):
+	return dialog(parent, caption, message, style=wx.OK|wx.ICON_ERROR, callback=callback)
 
-def warning(parent, caption, message):
-	return dialog(parent, caption, message, style=wx.OK|wx.ICON_WARNING)
+def warning(parent, caption, message, callback=None):
+	return dialog(parent, caption, message, style=wx.OK|wx.ICON_WARNING, callback=callback)
 
-def question(parent, caption, message, warning=False, cancelable=False):
+def question(parent, caption, message, warning=False, cancelable=False, callback=None):
 	style=wx.YES_NO
 	if warning:
 		style |= wx.ICON_WARNING
@@ -37,4 +70,4 @@ def question(parent, caption, message, warning=False, cancelable=False):
 		style |= wx.ICON_QUESTION
 	if cancelable:
 		style |= wx.CANCEL
-	return dialog(parent, caption, message, style=style)
+	return dialog(parent, caption, message, style=style, callback=callback)
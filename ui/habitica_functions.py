@@ -1,60 +1,135 @@
+import asyncio
 import json
+import logging
+import os
+import threading
 
-import pyperclip
-import requests
-import wx
-import habitica
-from habitica import api as habitica_api
-from habitica.constants import *
-from habitica import themes_manager
-
+from ui import action_journal
+from ui import app
+from ui import client as api_client
 from ui import config
 from ui import dialogs
+from ui import refresh
+from ui import request_scheduler
 from ui import sound
+from ui import sound_cache
+from ui import sync
+from ui import task_cache
+from ui import tasks
 from ui import utils
 
 
+log = logging.getLogger("habitica")
 api = None
+client = api_client.AsyncClient(lambda: api)
 sound_slug = "rosstavoTheme"
+# only used to stream sounds that haven't been downloaded yet
 player = sound.Sound()
-current_tasks = {}
+voices = sound.SoundPool()
+sounds = sound_cache.SoundCache(os.path.join(app.data_dir, "sounds"))
+# every sound play_sound can be asked for
+sound_names = ("daily", "todo", "reward", "plus_habit", "minus_habit", "Item_Drop")
+store = tasks.TaskStore()
+# seconds between full downloads that catch anything our patches missed
+integrity_interval = 10 * 60
+journal = action_journal.ActionJournal(os.path.join(app.data_dir, action_journal.filename))
+# undo information for scores we showed but the server hasn't confirmed yet, by journal key
+pending_undo = {}
+# whether the last request reached the server
+online = True
+# seconds between attempts to replay the journal while offline
+offline_retry_interval = 30
+# actions that would happen twice if resent after the server already got them
+resend_unsafe_ops = ("score", "create")
+# actions the server confirmed so far, a download started before the latest of them may not include it
+confirmed_actions = 0
+# held while confirming an action or applying a download, so neither sees the other half done
+confirmed_lock = threading.Lock()
+flush_timer = None
+flush_lock = threading.Lock()
+# polls for changes made elsewhere, see start_sync
+poller = None
+
+
+# habitica, requests, pyperclip and the audio device are imported or initialized on first use rather than up here, so the login dialog doesn't wait on them
+def __getattr__(name):
+	"""Expose habitica.constants (valid_task_types, difficulties, etc) as module attributes, importing it on first access"""
+	from habitica import constants
+	try:
+		return getattr(constants, name)
+	except AttributeError:
+		raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
 
 
 def init_api():
 	global api
+	from habitica import api as habitica_api
+	kwargs = {}
+	if config.config.get("api_url"):
+		kwargs["base_url"] = config.config["api_url"]
 	api = habitica_api.HabiticaAPI(
 		api_user=config.config["api_user"],
-		api_key=config.config["api_key"]
+		api_key=config.config["api_key"],
+		**kwargs
 	)
+	journal.set_owner(config.config["api_user"])
+
 
 
+def login(username, password):
+	"""Log in without waiting for the server.
 
-def login(parent, username, password):
+	returns:
+		A concurrent.futures.Future for the servers response, see login_failed for telling the user why it raised.
+	"""
 	if not api:
 		init_api()
-	try:
-		response = api.login(username, password)
-	except requests.exceptions.RequestException as exc:
-		if exc.response.status_code == 401:
-			dialogs.error(parent, "Error", "The username or password you entered is incorrect.")
-		else:
-			dialogs.error(parent, "Error logging in", str(exc))
+	return client.submit(client.call("login", (username, password)))
+
+
+def login_failed(parent, exc):
+	"""Tell the user why logging in raised exc, returning False if it's not something we know how to explain"""
+	import requests
+	if not isinstance(exc, requests.exceptions.RequestException):
 		return False
+	if exc.response is not None and exc.response.status_code == 401:
+		dialogs.error(parent, "Error", "The username or password you entered is incorrect.")
+	else:
+		dialogs.error(parent, "Error logging in", str(exc))
 	return True
 
 
 def play_sound(sound_name):
+	from habitica import themes_manager
 	sound_name = themes_manager.get_sound(sound_name)
 	if not sound_name:
 		return False
+	if voices.is_loaded(sound_name):
+		return voices.play(sound_name)
+	data = sounds.get(sound_slug, sound_name)
+	if data is not None:
+		return voices.play(sound_name, data)
+	# not downloaded yet, stream it this once and keep a copy for next time
 	url = themes_manager.join_sound_url(sound_slug, sound_name)
+	sounds.prefetch(sound_slug, [(sound_name, url)], callback=voices.preload)
 	if not player.url_stream(url):
 		return False
 	return player.play()
 
 
+def prefetch_sounds():
+	"""Download every sound of the current theme in the background"""
+	from habitica import themes_manager
+	theme_sounds = []
+	for sound_name in sound_names:
+		sound_name = themes_manager.get_sound(sound_name)
+		if sound_name:
+			theme_sounds.append((sound_name, themes_manager.join_sound_url(sound_slug, sound_name)))
+	return sounds.prefetch(sound_slug, theme_sounds, callback=voices.preload)
+
+
 def play_sound_for_task(task, up):
-	up = True if up or up == "up" else False
+	up = up in (True, "up")
 	if task.type == "daily":
 		play_sound("daily")
 	elif task.type == "todo":
@@ -68,112 +143,437 @@ def play_sound_for_task(task, up):
 			play_sound("minus_habit")
 
 def get_user(parent=None):
-	response_dict = api.get_user()
+	response_dict = client.run("get_user")
 	if not response_dict:
 		dialogs.error(parent, "Error", f"Could not retrieve user information: {response_dict}")
 		return False
 	return response_dict
 
 def get_tasks(parent=None):
-	response_dict = api.get_tasks_for_user()
+	response_dict = client.run("get_tasks_for_user")
 	if not response_dict.get("success"):
 		dialogs.error(parent, "Error", f"Could not retrieve your tasks: {response_dict}")
 		return False
-	tasks_dict = response_dict["data"]
+	tasks_dict = tasks.from_api(response_dict["data"])
 	return tasks_dict
 
-def get_incomplete_dailies(task_data):
-	choices = []
-	for task in task_data:
-		if task.type == "daily" and not task.completed:
-			choices.append(task)
-	return choices
+def fetch_startup():
+	"""Fetch the user and their tasks concurrently.
 
-def cron():
-	return api.cron()
+	returns:
+		A future for (user, tasks). Either one is an exception instead if fetching it failed.
+	"""
+	async def fetch():
+		user, response = await client.gather(client.call("get_user"), client.call("get_tasks_for_user"))
+		if isinstance(response, Exception):
+			return user, response
+		if not response.get("success"):
+			return user, RuntimeError(response)
+		task_list = tasks.from_api(response["data"])
+		await asyncio.to_thread(task_cache.save, task_list, owner=config.config["api_user"])
+		return user, task_list
+	return client.submit(fetch())
 
-@utils.run_threaded
-def update_tasks(parent, tasks_dict={}, update_ui=True):
-	global current_tasks
-	if not tasks_dict:
-		response = api.get_tasks_for_user()
-		tasks_dict = response["data"]
-	current_tasks = tasks_dict
-	items = {}
-	for item in tasks_dict:
+def load_cached_tasks():
+	"""Tasks saved by the last successful refresh, for rendering before the server answers"""
+	return task_cache.load(owner=config.config["api_user"])
+
+def set_tag_names(user):
+	"""Make tasks searchable by the names of their tags, which only the user object knows"""
+	names = {}
+	for tag in getattr(user, "tags", None) or []:
+		if isinstance(tag, dict):
+			names[tag.get("id")] = tag.get("name", "")
+		else:
+			names[getattr(tag, "id", None)] = getattr(tag, "name", "")
+	store.set_tag_names(names)
+
+def search_tasks(query):
+	"""Group the tasks matching query like group_tasks does, or every task if query is blank"""
+	found = store.search(query)
+	if found is None:
+		found = store.all()
+	return group_tasks(found)
+
+def get_incomplete_dailies():
+	return store.incomplete("daily")
+
+def group_tasks(task_list):
+	"""Group tasks by the tree node they belong under, e.g. {"habits": [...], "dailys": [...]}
+
+	Every type is present even when empty, so the tree also clears out types whose last task went away.
+	"""
+	from habitica.constants import valid_task_types
+	items = {type: [] for type in valid_task_types}
+	for item in task_list:
+		if item.type == "todo" and getattr(item, "completed", False):
+			continue  # the server only hands us incomplete todos, mirror that for locally completed ones
 		type = item.type+"s"
 		if not type in items:  # avoid KeyError
 			items[type] = []
 		items[type].append(item)
-	if not items:
+	return items
+
+def cron():
+	return client.run("cron")
+
+
+def score_tasks(task_list, up=True, max_concurrent=4):
+	"""Score several tasks at once, blocking until all of them are done.
+
+	At most max_concurrent requests are in flight at a time, all going through the one shared api session.
+	Blocks, so don't call from the UI thread.
+
+	returns:
+		A list of (task, result) pairs in the order given, where result is the servers response or the exception that was raised.
+	"""
+	up = "up" if up else "down"
+	calls = [client.call("score_task", (task.id, up)) for task in task_list]
+	responses = client.submit(client.gather(*calls, limit=max_concurrent)).result()
+	results = []
+	for task, result in zip(task_list, responses):
+		if score_succeeded(result):
+			store.score(task.id, up)
+			store.apply_score(task.id, result["data"])
+		results.append((task, result))
+	return results
+
+
+def score_succeeded(result):
+	return isinstance(result, dict) and result.get("success", False)
+
+
+@utils.run_threaded(kind="cron")
+def complete_dailies(task_list):
+	"""Mark yesterdays dailies as done and only then run cron, so no completion gets lost.
+
+	returns:
+		(results, cron_response), with results as returned by score_tasks.
+	"""
+	results = score_tasks(task_list, up=True)
+	return results, cron()
+
+def update_tasks(parent, tasks_dict=None, update_ui=True):
+	"""Replace the local tasks with tasks_dict, or with a fresh download if it's None. An empty list is applied as is, the account may simply have no tasks.
+
+	Downloads requested while another is already running are folded into one.
+	"""
+	if tasks_dict is not None:
+		apply_download(parent, tasks_dict, update_ui=update_ui)
+		return
+	refresher.request(parent, update_ui=update_ui)
+
+
+def refresh_tasks(parent, update_ui=True):
+	"""Download every task, blocking. Use update_tasks instead of calling this directly.
+
+	Only task types with changes since the last download are handed to the UI, and nothing at all if the download matches what we have.
+	A download that an action was confirmed during is thrown away and another one requested, as the server may have answered from before the action.
+	"""
+	confirmed = confirmed_actions
+	response = client.run("get_tasks_for_user", priority=request_scheduler.background_priority)
+	tasks_dict = tasks.from_api(response["data"])
+	if not tasks_dict:
 		print("error updating tasks")
+	if poller:
+		poller.note_refreshed()
+	with confirmed_lock:
+		stale = confirmed != confirmed_actions
+		if not stale:
+			changed = apply_download(parent, tasks_dict, update_ui=update_ui)
+	if stale:
+		# an action was confirmed while this was on its way and is no longer pending, so this copy could undo it
+		refresher.request(parent, update_ui=update_ui)
+		return
+	if changed:
+		task_cache.save(tasks_dict, owner=config.config["api_user"])
+	if not online and journal.pending():
+		# we're back, no need to wait for the retry timer
+		flush_actions(parent, update_ui=update_ui)
+
+
+refresher = refresh.RefreshScheduler(refresh_tasks)
+
+
+def apply_download(parent, task_list, update_ui=True):
+	"""Merge a complete task list from the server into the store and redraw whatever changed.
+
+	Tasks are compared by their updatedAt, which the on-disk cache keeps between runs, so a download matching what we already have costs no UI work at all.
+	The task endpoint doesn't offer ETags or If-Modified-Since, hence the full download.
+
+	returns:
+		Whether anything changed.
+	"""
+	changed, removed, reordered = store.sync(task_list)
+	pending = journal.pending()
+	apply_pending_actions()
+	types = {task.type for task in changed + removed} | reordered
 	if update_ui:
-		wx.CallAfter(parent.update_task_types, **items)
+		if pending:
+			# pending actions were undone and reapplied, which may touch any type
+			render_tasks(parent)
+		elif types:
+			render_tasks(parent, types=types)
+	return bool(types)
+
+
+def start_sync(parent):
+	"""Keep parent up to date with changes made on other devices"""
+	global poller
+	if poller:
+		poller.stop()
+	poller = sync.SyncPoller(lambda: update_tasks(parent))
+	poller.start()
+
+
+def stop_sync():
+	if poller:
+		poller.stop()
+
+
+def set_tasks(task_list):
+	"""Seed the store with tasks that didn't come from the server, e.g. the on-disk cache"""
+	store.replace(task_list, synced=False)
+	apply_pending_actions()
+
+
+def render_tasks(parent, types=None):
+	"""Redraw parent from the local copy of the tasks, without asking the server.
+
+	args:
+		types (set): Only redraw these task types (e.g. {"todo"}), all of them if not given.
+	"""
+	if getattr(parent, "search_query", ""):
+		# a filter can hide or reveal tasks of any type, and the query may change before this reaches the UI thread
+		utils.call_in_ui(parent.show_search_results)
+		return
+	from habitica.constants import valid_task_types
+	if types is None:
+		types = {group[:-1] for group in valid_task_types}
+	groups = {type+"s": group_tasks(store.of_type(type)).get(type+"s", []) for type in types}
+	utils.call_in_ui(parent.update_task_types, **groups)
+
+
+def tasks_patched(parent, update_ui=True):
+	"""Show the result of a patch, falling back to a full download when the integrity check is due"""
+	if not update_ui:
+		return
+	if store.needs_integrity_check(integrity_interval):
+		update_tasks(parent)
+	else:
+		render_tasks(parent)
 
 
-@utils.run_threaded
 def score_task(parent, task, up=True, update_ui=True):
+	"""Score a task, showing the expected result right away and confirming with the server in the background"""
 	if not task or not hasattr(task, "id"):
 		return
 	up = "up" if up else "down"
-	# get the current set of user stats so we have a basis for comparison
-	## todo: remove if this becomes too costly. If so we could fall back on api.current_user which is cached and not guaranteed to be valid
-	#user = api.get_user()
-	user = api.cached_user
-	response = api.score_task(task.id, up)
-	if not response["success"]:
-		wx.CallAfter(dialogs.error, parent, "Error", f"An error occurred while attempting to score the selected task {up}: {response}")
-		return
-	data = response["data"]
-	# do we have an item drop?
-	tmp = data.get("_tmp", {})
-	drop = tmp.get("drop")
-	if drop:  # we do
-		print(tmp)
-		wx.CallAfter(dialogs.information, parent, f"{drop['key']} ({drop.get('target', '')} {drop.get('type', '')}!)", drop["dialog"])
-		wx.CallAfter(play_sound, "Item_Drop")
-	# have our stats changed?
-	stat_changes = user.diff_stats(api._cached_user.stats)
-	if stat_changes:
-		wx.CallAfter(dialogs.information, parent, "Information", stat_changes)
-	wx.CallAfter(play_sound_for_task, task, up)
-	if update_ui:
-		update_tasks(parent, update_ui=update_ui)
+	utils.call_in_ui(play_sound_for_task, task, up)
+	return record_action(parent, "score", {"task_id": task.id, "direction": up}, update_ui=update_ui)
 
 
-@utils.run_threaded
 def create_task(parent, task_data):
-	type = task_data["type"]
-	text = task_data["text"]
-	del task_data["type"]
-	del task_data["text"]
-	response = api.create_task(type, text, **task_data)
-	if not response["success"]:
-		dialogs.error(parent, "Error", f"An error occurred while attempting to create the given task: {response}")
-		return
-	update_tasks(parent)
+	key = journal.new_key()
+	# stands in for the real id until the server hands one out
+	task_data = dict(task_data, local_id="local-"+key)
+	return record_action(parent, "create", task_data, key=key)
 
 
-@utils.run_threaded
 def update_task(parent, task_data):
-	task_id= task_data["id"]
-	del task_data["id"]
-	response = api.update_task(task_id, **task_data)
-	if not response["success"]:
-		dialogs.error(parent, "Error", f"An error occurred while attempting to modify the given task: {response}")
-		return
-	update_tasks(parent)
+	return record_action(parent, "update", dict(task_data))
+
+
+def delete_task(parent, task):
+	return record_action(parent, "delete", {"task_id": task.id})
+
 
 def copy_json(parent, cls):
+	import pyperclip
 	pyperclip.copy(cls.to_json())
 
-@utils.run_threaded
-def delete_task(parent, task):
-	confirmation = dialogs.question(parent, "Delete task?", "Are you sure you want to delete the selected "+task.type+"?", warning=True)
-	if confirmation:
-		print("deleting")
-		response = api.delete_task(task._id)
-		if not response["success"]:
-			dialogs.error(parent, "Error", "There was an error deleting the requested "+task.type+": "+response)
+
+def record_action(parent, op, args, key=None, update_ui=True):
+	"""Journal an action, apply it to the local tasks and have it sent in the background.
+
+	Actions are sent strictly in the order they were recorded. If we're offline they stay in the journal and are replayed once the server is reachable again, possibly in a later session.
+	"""
+	if poller:
+		poller.note_activity()
+	action = journal.append(op, args, key=key)
+	undo = apply_action(action)
+	if undo:
+		pending_undo[action["key"]] = undo
+	if update_ui:
+		render_tasks(parent)
+	return flush_actions(parent, update_ui=update_ui)
+
+
+def apply_action(action):
+	"""Make the local tasks look like action went through. Returns whatever is needed to take a score back"""
+	args = action["args"]
+	op = action["op"]
+	if op == "score":
+		return store.score(args["task_id"], args["direction"])
+	elif op == "create":
+		fields = {key: value for key, value in args.items() if key != "local_id"}
+		store.add(tasks.Task(_id=args["local_id"], id=args["local_id"], **fields))
+	elif op == "update":
+		fields = {key: value for key, value in args.items() if key != "id"}
+		store.patch(args["id"], fields)
+	elif op == "delete":
+		store.remove(args["task_id"])
+
+
+def apply_pending_actions():
+	"""Reapply everything still waiting in the journal, e.g. on top of a fresh download that doesn't include it yet"""
+	for action in journal.pending():
+		apply_action(action)
+
+
+def send_action(action):
+	"""Send one journaled action, returning the servers response"""
+	args = dict(action["args"])
+	op = action["op"]
+	if op == "score":
+		return client.run("score_task", (journal.resolve(args["task_id"]), args["direction"]))
+	if op == "create":
+		del args["local_id"]
+		type = args.pop("type")
+		text = args.pop("text")
+		return client.run("create_task", (type, text), args)
+	if op == "update":
+		task_id = journal.resolve(args.pop("id"))
+		return client.run("update_task", (task_id,), args)
+	if op == "delete":
+		return client.run("delete_task", (journal.resolve(args["task_id"]),))
+	raise ValueError(f"Unknown action {op}")
+
+
+@utils.run_threaded(kind="actions", key=lambda *args, **kwargs: "actions")
+def flush_actions(parent, update_ui=True):
+	"""Send every pending action in order, stopping at the first one that can't reach the server"""
+	global online, confirmed_actions
+	import requests
+	conflicts = []
+	# types of tasks whose optimistic change was taken back
+	rolled_back = set()
+	sent = False
+	# whether an action may or may not have gone through, only a download can tell
+	ambiguous = False
+	for action in journal.pending():
+		# get the current set of user stats so we have a basis for comparison
+		## todo: remove if this becomes too costly. If so we could fall back on api.current_user which is cached and not guaranteed to be valid
+		user = api.cached_user if action["op"] == "score" else None
+		try:
+			response = send_action(action)
+		except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as exc:
+			# offline, keep everything after it for later
+			online = False
+			schedule_flush(parent)
+			if not never_sent(exc) and action["op"] in resend_unsafe_ops:
+				# the server may have acted on it already, sending it again could score or create twice
+				log.warning(f"Outcome of {action['op']} {action['key']} is unknown, not resending it: {exc}")
+				journal.done(action["key"], ambiguous=True)
+				pending_undo.pop(action["key"], None)
+				ambiguous = True
+			break
+		except requests.exceptions.RequestException as exc:
+			response = {"success": False, "error": str(exc)}
+		online = True
+		sent = True
+		undo = pending_undo.pop(action["key"], None)
+		if response.get("success"):
+			local_id = action["args"].get("local_id")
+			with confirmed_lock:
+				confirmed_actions += 1
+				journal.done(action["key"], local_id=local_id, id=response["data"].get("_id") if local_id else None)
+				action_confirmed(parent, action, response, user)
+		else:
+			journal.done(action["key"])
+			task = store.get(action["args"].get("task_id"))
+			if undo and task:
+				store.patch(task.id, undo)
+				rolled_back.add(task.type)
+			conflicts.append((action, response))
+	journal.compact()
+	if ambiguous:
+		# with the action settled, the download replaces what we showed with whatever the server really did
+		update_tasks(parent, update_ui=update_ui)
+	if conflicts:
+		report_conflicts(parent, conflicts)
+		if update_ui:
+			# the store already matches the server again for these, so the download below wouldn't see anything to redraw
+			if rolled_back:
+				render_tasks(parent, types=rolled_back)
+			# the server disagrees with what we showed, so get its version of everything
+			update_tasks(parent)
+	elif sent:
+		tasks_patched(parent, update_ui=update_ui)
+
+
+def never_sent(exc):
+	"""Whether a ConnectionError or Timeout from requests happened before the request could reach the server.
+
+	Anything else, e.g. a read timeout or the connection dropping while waiting for the response, leaves it unknown whether the server acted on it.
+	"""
+	import requests
+	import urllib3
+	if isinstance(exc, (requests.exceptions.ConnectTimeout, requests.exceptions.SSLError, requests.exceptions.ProxyError)):
+		return True
+	if isinstance(exc, requests.exceptions.Timeout):
+		return False
+	reason = exc.args[0] if exc.args else None
+	if isinstance(reason, urllib3.exceptions.MaxRetryError):
+		reason = reason.reason
+	return isinstance(reason, urllib3.exceptions.NewConnectionError)
+
+
+def action_confirmed(parent, action, response, user):
+	data = response["data"]
+	args = action["args"]
+	op = action["op"]
+	if op == "score":
+		store.apply_score(journal.resolve(args["task_id"]), data)
+		# do we have an item drop?
+		tmp = data.get("_tmp", {})
+		drop = tmp.get("drop")
+		if drop:  # we do
+			dialogs.information(parent, f"{drop['key']} ({drop.get('target', '')} {drop.get('type', '')}!)", drop["dialog"])
+			utils.call_in_ui(play_sound, "Item_Drop")
+		# have our stats changed? can't tell if the user wasn't loaded yet when this was sent
+		stat_changes = user.diff_stats(api._cached_user.stats) if user is not None else None
+		if stat_changes:
+			dialogs.information(parent, "Information", stat_changes)
+	elif op == "create":
+		store.remove(args["local_id"])
+		store.add(data)
+	elif op == "update":
+		store.update(data)
+
+
+def report_conflicts(parent, conflicts):
+	descriptions = {
+		"score": "score a task",
+		"create": "create a task",
+		"update": "modify a task",
+		"delete": "delete a task",
+	}
+	lines = [f"Could not {descriptions.get(action['op'], action['op'])}: {response.get('error', response)}" for action, response in conflicts]
+	dialogs.error(parent, "Error", "The server rejected the following changes:\n" + "\n".join(lines))
+
+
+def schedule_flush(parent):
+	"""Try the journal again in a little while, once"""
+	global flush_timer
+	with flush_lock:
+		if flush_timer:
 			return
-		update_tasks(parent)
+		def retry():
+			global flush_timer
+			with flush_lock:
+				flush_timer = None
+			flush_actions(parent)
+		flush_timer = threading.Timer(offline_retry_interval, retry)
+		flush_timer.daemon = True
+		flush_timer.start()
@@ -0,0 +1,82 @@
+"""Coalescing of task list refreshes"""
+
+import threading
+import time
+
+from ui import workers
+
+
+class RefreshScheduler:
+	"""Folds overlapping refresh requests into a single download.
+
+	A request made while idle runs straight away. Requests made while a refresh is in flight are remembered and produce exactly one more refresh once it finishes, after delay seconds without further requests (a trailing debounce).
+	"""
+
+	def __init__(self, refresh, delay=0.3):
+		"""args:
+			refresh (callable): Does the actual (blocking) work, called as refresh(parent, update_ui) on the worker pool.
+			delay (float): Seconds of quiet to wait for before running a trailing refresh.
+		"""
+		self.refresh = refresh
+		self.delay = delay
+		self.lock = threading.Lock()
+		self.in_flight = False
+		self.timer = None
+		self.deadline = 0
+		self.pending = False
+		self.parent = None
+		self.update_ui = False
+
+	def request(self, parent, update_ui=True):
+		with self.lock:
+			self.parent = parent
+			# if anybody wants the UI updated, whoever runs next updates it
+			self.update_ui = self.update_ui or update_ui
+			self.pending = True
+			if self.in_flight or self.timer:
+				self.deadline = time.monotonic() + self.delay
+				return
+			self._start()
+
+	def _start(self):
+		# must hold self.lock
+		self.in_flight = True
+		self.pending = False
+		parent, update_ui = self.parent, self.update_ui
+		self.update_ui = False
+		workers.pool.run(self._run, (parent, update_ui), kind="refresh")
+
+	def _run(self, parent, update_ui):
+		try:
+			self.refresh(parent, update_ui)
+		finally:
+			with self.lock:
+				self.in_flight = False
+				if self.pending:
+					self.deadline = max(self.deadline, time.monotonic() + self.delay)
+					self._schedule()
+
+	def _schedule(self):
+		# must hold self.lock
+		self.timer = threading.Timer(max(0, self.deadline - time.monotonic()), self._on_timer)
+		self.timer.daemon = True
+		self.timer.start()
+
+	def _on_timer(self):
+		with self.lock:
+			self.timer = None
+			if self.in_flight or not self.pending:
+				return
+			if time.monotonic() < self.deadline:
+				# more requests came in while we slept
+				self._schedule()
+				return
+			self._start()
+
+	def cancel(self):
+		"""Drop any trailing refresh that hasn't started yet"""
+		with self.lock:
+			self.pending = False
+			if self.timer:
+				self.timer.cancel()
+				self.timer = None
@@ -0,0 +1,146 @@
+"""Client side rate limiting and retries for API requests"""
+
+import asyncio
+import email.utils
+import heapq
+import itertools
+import logging
+import random
+import time
+
+
+log = logging.getLogger("request_scheduler")
+# lower goes first: whatever the user is waiting on beats background refreshes
+user_priority = 0
+background_priority = 1
+# habitica allows 30 requests per minute
+default_rate = 30 / 60
+default_capacity = 30
+
+
+class RequestScheduler:
+	"""Token bucket with priority classes, plus retries with jittered exponential backoff.
+
+	Lives on the client event loop and is only ever touched from it, so there's no locking.
+	"""
+
+	def __init__(self, rate=default_rate, capacity=default_capacity, max_retries=4, base_delay=1.0, max_delay=60.0):
+		"""args:
+			rate (float): Tokens added per second.
+			capacity (int): Size of the bucket, i.e. how many requests can go out back to back.
+			max_retries (int): Attempts after the first before giving up.
+			base_delay (float): Upper bound of the first backoff in seconds, doubled after every failure.
+			max_delay (float): Upper bound of any single backoff.
+		"""
+		self.rate = rate
+		self.capacity = capacity
+		self.max_retries = max_retries
+		self.base_delay = base_delay
+		self.max_delay = max_delay
+		self.tokens = capacity
+		self.updated = time.monotonic()
+		# nobody gets a token before this, set when the server tells us to back off
+		self.paused_until = 0
+		self.waiters = []
+		self.counter = itertools.count()
+		self.timer = None
+
+	def refill(self):
+		now = time.monotonic()
+		self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+		self.updated = now
+
+	async def acquire(self, priority=user_priority):
+		"""Wait for a token. Waiters are served by priority, then in arrival order"""
+		future = asyncio.get_running_loop().create_future()
+		heapq.heappush(self.waiters, (priority, next(self.counter), future))
+		self.dispatch()
+		await future
+
+	def dispatch(self):
+		self.refill()
+		now = time.monotonic()
+		while self.waiters and self.tokens >= 1 and now >= self.paused_until:
+			_, _, future = heapq.heappop(self.waiters)
+			if future.done():  # cancelled while waiting
+				continue
+			self.tokens -= 1
+			future.set_result(None)
+		# drop cancelled waiters so they don't keep the timer alive
+		while self.waiters and self.waiters[0][2].done():
+			heapq.heappop(self.waiters)
+		if self.waiters and not self.timer:
+			delay = max((1 - self.tokens) / self.rate, self.paused_until - now, 0.01)
+			self.timer = asyncio.get_running_loop().call_later(delay, self.on_timer)
+
+	def on_timer(self):
+		self.timer = None
+		self.dispatch()
+
+	def pause(self, seconds):
+		"""Hold back every request for seconds, e.g. after a 429"""
+		self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+		self.tokens = 0
+		self.updated = time.monotonic()
+
+	def backoff(self, attempt, retry_after=None):
+		if retry_after is not None:
+			# a server asking for an hour shouldn't hold anybody up for an hour
+			return min(self.max_delay, retry_after) + random.uniform(0, self.base_delay)
+		# full jitter, so a burst of failures doesn't come back in lockstep
+		return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+	async def run(self, call, priority=user_priority, idempotent=False):
+		"""Await call() once a token is available, retrying it when the server is overloaded.
+
+		429s and 503s are always retried since the server didn't act on the request. Other 5xx responses are only retried for idempotent calls, as the action may have gone through.
+
+		args:
+			call (callable): Returns a new awaitable for every attempt.
+		"""
+		for attempt in range(self.max_retries + 1):
+			await self.acquire(priority)
+			status, retry_after, result, error = None, None, None, None
+			try:
+				result = await call()
+			except Exception as exc:
+				response = getattr(exc, "response", None)
+				if response is None:
+					raise
+				status = response.status_code
+				retry_after = parse_retry_after(response.headers.get("Retry-After"))
+				error = exc
+			else:
+				# the api wrapper sometimes hands back the error body instead of raising
+				if isinstance(result, dict) and result.get("error") == "TooManyRequests":
+					status = 429
+			if not retryable(status, idempotent) or attempt == self.max_retries:
+				if error:
+					raise error
+				return result
+			delay = self.backoff(attempt, retry_after)
+			if status == 429:
+				self.pause(delay)
+			log.warning(f"Request failed with {status}, retrying in {delay:.1f} seconds")
+			await asyncio.sleep(delay)
+
+
+def retryable(status, idempotent):
+	if status in (429, 503):
+		return True
+	return idempotent and status is not None and status >= 500
+
+
+def parse_retry_after(value):
+	"""Seconds to wait according to a Retry-After header, which may hold a number of seconds or a date"""
+	if not value:
+		return None
+	try:
+		return max(0.0, float(value))
+	except ValueError:
+		pass
+	try:
+		when = email.utils.parsedate_to_datetime(value)
+	except (TypeError, ValueError):
+		return None
+	return max(0.0, when.timestamp() - time.time())
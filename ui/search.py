@@ -0,0 +1,106 @@
+import bisect
+import re
+import threading
+
+
+word_pattern = re.compile(r"\w+")
+
+
+def tokenize(text):
+	"""Split text into lowercase words"""
+	if not text or not isinstance(text, str):
+		return []
+	return word_pattern.findall(text.lower())
+
+
+class SearchIndex:
+	"""Inverted index from words to task ids, for searching tasks as the user types.
+
+	Covers the text, notes, checklist items and tags of each task. Tasks are (re)indexed one at a time as they change, and every word of a query matches as a prefix, so "wat pl" finds "Water the plants".
+	"""
+
+	def __init__(self):
+		self.lock = threading.RLock()
+		# word -> set of task ids
+		self.postings = {}
+		# every word in postings, sorted so prefixes can be found with bisect
+		self.words = []
+		# task id -> the words it was indexed under, to undo that when it changes
+		self.task_words = {}
+		# tag id -> name, tags are indexed by name when we know it
+		self.tag_names = {}
+
+	def terms(self, task):
+		"""Every word task should be found by"""
+		words = set(tokenize(task.get("text")))
+		words.update(tokenize(task.get("notes")))
+		for item in task.get("checklist") or []:
+			if isinstance(item, dict):
+				words.update(tokenize(item.get("text")))
+		for tag in task.get("tags") or []:
+			words.update(tokenize(self.tag_names.get(tag, tag)))
+		return words
+
+	def update(self, task):
+		"""Index task, or bring its entry up to date. Only words that were added or dropped are touched"""
+		words = self.terms(task)
+		with self.lock:
+			old = self.task_words.get(task.id, set())
+			for word in old - words:
+				self.drop(word, task.id)
+			for word in words - old:
+				self.add(word, task.id)
+			self.task_words[task.id] = words
+
+	def remove(self, task_id):
+		with self.lock:
+			for word in self.task_words.pop(task_id, ()):
+				self.drop(word, task_id)
+
+	def clear(self):
+		with self.lock:
+			self.postings = {}
+			self.words = []
+			self.task_words = {}
+
+	def add(self, word, task_id):
+		ids = self.postings.get(word)
+		if ids is None:
+			ids = self.postings[word] = set()
+			bisect.insort(self.words, word)
+		ids.add(task_id)
+
+	def drop(self, word, task_id):
+		ids = self.postings.get(word)
+		if ids is None:
+			return
+		ids.discard(task_id)
+		if not ids:
+			del self.postings[word]
+			index = bisect.bisect_left(self.words, word)
+			if index < len(self.words) and self.words[index] == word:
+				del self.words[index]
+
+	def prefixed(self, prefix):
+		"""The ids of every task with a word starting with prefix"""
+		ids = set()
+		index = bisect.bisect_left(self.words, prefix)
+		while index < len(self.words) and self.words[index].startswith(prefix):
+			ids.update(self.postings[self.words[index]])
+			index += 1
+		return ids
+
+	def search(self, query):
+		"""The ids of tasks matching every word of query as a prefix, None if query has no words at all"""
+		words = tokenize(query)
+		if not words:
+			return
+		with self.lock:
+			# longest words first, they usually narrow things down the most
+			words.sort(key=len, reverse=True)
+			ids = self.prefixed(words[0])
+			for word in words[1:]:
+				if not ids:
+					break
+				ids &= self.prefixed(word)
+			return ids
@@ -1,38 +1,137 @@
 import ctypes
 import os
 import math
-import sound_lib
-from sound_lib import output, stream
+import threading
+
+from ui import trace
+
+
+# the audio device is opened by the first sound that needs it, see init_output
+o = None
+
+
+def init_output():
+	"""Import sound_lib and open the output device if that hasn't happened yet"""
+	global o
+	if o is None:
+		from sound_lib import output
+		o = output.Output()
+	return o
+
+
+class Py_buffer(ctypes.Structure):
+	"""The C level view of an object supporting the buffer protocol"""
+	_fields_ = [
+		("buf", ctypes.c_void_p),
+		("obj", ctypes.c_void_p),
+		("len", ctypes.c_ssize_t),
+		("itemsize", ctypes.c_ssize_t),
+		("readonly", ctypes.c_int),
+		("ndim", ctypes.c_int),
+		("format", ctypes.c_char_p),
+		("shape", ctypes.POINTER(ctypes.c_ssize_t)),
+		("strides", ctypes.POINTER(ctypes.c_ssize_t)),
+		("suboffsets", ctypes.POINTER(ctypes.c_ssize_t)),
+		("internal", ctypes.c_void_p),
+	]
+
+
+PyObject_GetBuffer = ctypes.pythonapi.PyObject_GetBuffer
+PyObject_GetBuffer.argtypes = (ctypes.py_object, ctypes.POINTER(Py_buffer), ctypes.c_int)
+PyObject_GetBuffer.restype = ctypes.c_int
+PyBuffer_Release = ctypes.pythonapi.PyBuffer_Release
+PyBuffer_Release.argtypes = (ctypes.POINTER(Py_buffer),)
+PyBuffer_Release.restype = None
+# contiguous bytes, read-only is fine since BASS never writes to the data
+PyBUF_SIMPLE = 0
+
+
+class SoundBuffer:
+	"""Encoded sound data pinned in memory for BASS to read from.
+
+	Nothing is copied for bytes or anything else contiguous exposing the buffer protocol, read-only or not (memoryview, bytearray, an mmap of a cached file opened with ACCESS_READ).
+	Only non-contiguous views are copied, once. Either way one SoundBuffer can back any number of handles at the same time.
+	"""
+
+	def __init__(self, data):
+		self.view = None
+		if isinstance(data, bytes):
+			# c_char_p points straight at the bytes objects own storage
+			self.pointer = ctypes.c_char_p(data)
+			self.address = ctypes.cast(self.pointer, ctypes.c_void_p).value
+			self.length = len(data)
+		else:
+			view = Py_buffer()
+			try:
+				# exporting the buffer also stops it from being resized or closed (e.g. mmap.close) while BASS reads from it
+				PyObject_GetBuffer(data, ctypes.byref(view), PyBUF_SIMPLE)
+			except BufferError:
+				self.__init__(memoryview(data).tobytes())
+				return
+			self.view = view
+			self.address = view.buf
+			self.length = view.len
+		# hold on to the source so the memory stays valid for as long as we do
+		self.source = data
+
+	def __len__(self):
+		return self.length
+
+	def __del__(self):
+		if self.view is not None:
+			PyBuffer_Release(ctypes.byref(self.view))
+			self.view = None
 
 
 class Sound:
 	def __init__(self):
 		self.handle = None
+		# the memory BASS is reading from for in memory streams, must outlive the handle
+		self.buffer = None
 		self.freq = 44100
 
 	def load(self, filename=""):
+		init_output()
+		import sound_lib
+		from sound_lib import stream
 		if self.is_active:
 			self.close()
 		try:
 			if isinstance(filename, str): # Asume path on disk.
 				self.handle = stream.FileStream(file=filename)
 			else: # binary data.
-				self.handle = stream.FileStream(mem=True, file=filename, length=len(filename))
+				self.buffer = filename if isinstance(filename, SoundBuffer) else SoundBuffer(filename)
+				self.handle = stream.FileStream(mem=True, file=self.buffer.address, length=self.buffer.length)
 		except sound_lib.main.BassError:
 			return False
 		self.freq = self.handle.get_frequency()
 		return self.is_active
 
 	def stream(self, data):
+		"""Play from memory without copying.
+
+		args:
+			data: A SoundBuffer, or anything SoundBuffer accepts. Pass the same SoundBuffer to share one copy of the data between sounds.
+		"""
+		init_output()
+		import sound_lib
+		from sound_lib import stream
 		if self.is_active:
 			self.close()
 		if not data:
 			return False
-		data = ctypes.create_string_buffer(data)
-		self.handle = stream.FileStream(mem=True, file=ctypes.addressof(data), length=len(data))
+		if not isinstance(data, SoundBuffer):
+			data = SoundBuffer(data)
+		try:
+			self.handle = stream.FileStream(mem=True, file=data.address, length=data.length)
+		except sound_lib.main.BassError:
+			return False
+		self.buffer = data
 		return self.is_active
 
 	def url_stream(self, address):
+		init_output()
+		from sound_lib import stream
 		if self.is_active:
 			self.close()
 		if not address or not "://" in address:
@@ -64,6 +163,14 @@ class Sound:
 		self.looping = True
 		return bool(self.handle.play())
 
+	def restart(self):
+		"""Play again from the beginning, reusing the already loaded handle"""
+		if not self.is_active:
+			return False
+		self.handle.looping = False
+		self.handle.set_position(0)
+		return bool(self.handle.play())
+
 	def stop(self):
 		if self.is_active and self.handle.is_playing:
 			self.handle.stop()
@@ -133,5 +240,77 @@ class Sound:
 	def is_active(self):
 		return bool(self.handle)
 
+	@property
+	def is_playing(self):
+		return self.is_active and bool(self.handle.is_playing)
+
+
+class SoundPool:
+	"""Preloaded voices keyed by sound name, so effects can overlap and replays reuse their handle.
+
+	Each name gets up to max_voices voices. When all of them are busy the one that started playing longest ago is restarted.
+	"""
 
-o = output.Output()
+	def __init__(self, max_voices=4):
+		self.max_voices = max_voices
+		self.voices = {}
+		self.lock = threading.Lock()
+
+	@trace.traced("sound preload", "sound")
+	def preload(self, name, data):
+		"""Make sure name has at least one voice ready to play"""
+		with self.lock:
+			if self.voices.get(name):
+				return True
+			voice = self._new_voice(data)
+			if not voice:
+				return False
+			self.voices[name] = [voice]
+			return True
+
+	def is_loaded(self, name):
+		with self.lock:
+			return bool(self.voices.get(name))
+
+	def play(self, name, data=None):
+		"""Play name on a free voice, loading it from data if it isn't loaded yet"""
+		with self.lock:
+			# kept in the order they last started in, oldest first
+			voices = self.voices.setdefault(name, [])
+			for index, voice in enumerate(voices):
+				if not voice.is_playing:
+					voices.append(voices.pop(index))
+					return voice.restart()
+			if len(voices) < self.max_voices and (voices or data):
+				voice = self._new_voice(data or voices[0].data)
+				if voice:
+					voices.append(voice)
+					return voice.play()
+			if not voices:
+				return False
+			# every voice is busy, steal the oldest and move it to the back of the line
+			voice = voices.pop(0)
+			voices.append(voice)
+			return voice.restart()
+
+	def _new_voice(self, data):
+		if not isinstance(data, SoundBuffer):
+			data = SoundBuffer(data)
+		voice = Sound()
+		if not voice.stream(data):
+			return None
+		voice.data = data
+		return voice
+
+	def stop(self):
+		with self.lock:
+			for voices in self.voices.values():
+				for voice in voices:
+					voice.stop()
+
+	def close(self):
+		with self.lock:
+			for voices in self.voices.values():
+				for voice in voices:
+					voice.close()
+			self.voices = {}
@@ -0,0 +1,128 @@
+"""Local copies of theme sounds, so playing one never waits on the network"""
+
+import collections
+import logging
+import mmap
+import os
+import threading
+
+from ui import sound
+from ui import trace
+from ui import workers
+
+
+log = logging.getLogger("sound_cache")
+
+
+class SoundCache:
+	"""Sounds kept in memory and on disk, both bounded in size.
+
+	In memory they're kept as sound.SoundBuffer, so every play shares one copy of the data. Files read back from disk are memory mapped rather than copied.
+
+	Files live under directory/<theme slug>/<sound file>. The least recently used are evicted first.
+	"""
+
+	def __init__(self, directory, max_disk_bytes=32 * 1024 * 1024, max_memory_bytes=8 * 1024 * 1024):
+		self.directory = directory
+		self.max_disk_bytes = max_disk_bytes
+		self.max_memory_bytes = max_memory_bytes
+		self.lock = threading.Lock()
+		self.memory = collections.OrderedDict()
+		self.memory_bytes = 0
+
+	def path(self, slug, name):
+		return os.path.join(self.directory, slug, os.path.basename(name))
+
+	@trace.traced("sound get", "sound")
+	def get(self, slug, name):
+		"""Return the sound if we have it locally, without touching the network"""
+		key = (slug, name)
+		with self.lock:
+			data = self.memory.get(key)
+			if data is not None:
+				self.memory.move_to_end(key)
+				return data
+		path = self.path(slug, name)
+		try:
+			with open(path, "rb") as f:
+				# mapped rather than read, BASS plays straight from the page cache
+				data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+			os.utime(path)  # the modification time doubles as last use for eviction
+		except (OSError, ValueError):  # ValueError for empty files, which can't be mapped
+			return None
+		return self.remember(key, data)
+
+	@trace.traced("sound fetch", "sound")
+	def fetch(self, slug, name, url):
+		"""Return the sound, downloading it first if needed. Blocks"""
+		import requests
+		data = self.get(slug, name)
+		if data is not None:
+			return data
+		try:
+			response = requests.get(url, timeout=15)
+			response.raise_for_status()
+		except requests.exceptions.RequestException:
+			log.exception(f"While downloading {url}")
+			return None
+		return self.store(slug, name, response.content)
+
+	def store(self, slug, name, data):
+		path = self.path(slug, name)
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		tmp_path = path + ".tmp"
+		try:
+			with open(tmp_path, "wb") as f:
+				f.write(data)
+			os.replace(tmp_path, path)
+		except OSError:
+			log.exception("While writing to the sound cache")
+		data = self.remember((slug, name), data)
+		self.evict()
+		return data
+
+	def remember(self, key, data):
+		data = sound.SoundBuffer(data)
+		with self.lock:
+			if key in self.memory:
+				self.memory_bytes -= len(self.memory.pop(key))
+			self.memory[key] = data
+			self.memory_bytes += len(data)
+			while self.memory_bytes > self.max_memory_bytes and len(self.memory) > 1:
+				_, evicted = self.memory.popitem(last=False)
+				self.memory_bytes -= len(evicted)
+		return data
+
+	def evict(self):
+		"""Delete the least recently used files until the cache fits in max_disk_bytes"""
+		files = []
+		for root, dirs, names in os.walk(self.directory):
+			for name in names:
+				path = os.path.join(root, name)
+				try:
+					stat = os.stat(path)
+				except OSError:
+					continue
+				files.append((stat.st_mtime, stat.st_size, path))
+		total = sum(size for _, size, _ in files)
+		for _, size, path in sorted(files):
+			if total <= self.max_disk_bytes:
+				break
+			try:
+				os.remove(path)
+			except OSError:
+				continue
+			total -= size
+
+	def prefetch(self, slug, sounds, callback=None):
+		"""Download every (name, url) pair in sounds in the background.
+
+		args:
+			callback (callable): Called as callback(name, data) for every sound that is available afterwards, e.g. to preload it.
+		"""
+		def prefetch_all():
+			for name, url in sounds:
+				data = self.fetch(slug, name, url)
+				if data is not None and callback:
+					callback(name, data)
+		return workers.pool.run(prefetch_all, kind="sound")
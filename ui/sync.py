@@ -0,0 +1,85 @@
+"""Background polling for changes made on other devices"""
+
+import threading
+import time
+
+
+class SyncPoller:
+	"""Asks for a task refresh periodically, more often while the user is around.
+
+	Polls every active_interval seconds while the window is focused or the user did something recently, every idle_interval seconds otherwise, and not at all while minimized.
+	Refreshes that turn up nothing new cost no UI work, see habitica_functions.apply_download.
+	"""
+
+	def __init__(self, refresh, active_interval=60, idle_interval=5 * 60, activity_window=2 * 60):
+		"""args:
+			refresh (callable): Requests a refresh, must not block.
+			activity_window (float): Seconds after the last user action during which we still poll at the active rate.
+		"""
+		self.refresh = refresh
+		self.active_interval = active_interval
+		self.idle_interval = idle_interval
+		self.activity_window = activity_window
+		self.focused = True
+		self.minimized = False
+		self.last_activity = time.monotonic()
+		self.last_poll = time.monotonic()
+		# set whenever something changes that may affect when the next poll is due
+		self.wake = threading.Event()
+		self.stopped = False
+		self.thread = None
+
+	@property
+	def interval(self):
+		"""Seconds between polls right now, None while paused"""
+		if self.minimized:
+			return None
+		if self.focused or time.monotonic() - self.last_activity < self.activity_window:
+			return self.active_interval
+		return self.idle_interval
+
+	def start(self):
+		if self.thread:
+			return
+		self.stopped = False
+		self.thread = threading.Thread(target=self.run, name="sync-poller", daemon=True)
+		self.thread.start()
+
+	def stop(self):
+		self.stopped = True
+		self.wake.set()
+		self.thread = None
+
+	def set_focused(self, focused):
+		self.focused = focused
+		if focused:
+			self.last_activity = time.monotonic()
+		self.wake.set()
+
+	def set_minimized(self, minimized):
+		self.minimized = minimized
+		self.wake.set()
+
+	def note_activity(self):
+		self.last_activity = time.monotonic()
+		self.wake.set()
+
+	def note_refreshed(self):
+		"""A refresh happened for some other reason, so the next poll can wait a full interval"""
+		self.last_poll = time.monotonic()
+
+	def run(self):
+		while not self.stopped:
+			interval = self.interval
+			if interval is None:
+				self.wake.wait()
+			else:
+				self.wake.wait(max(0, self.last_poll + interval - time.monotonic()))
+			if self.wake.is_set():
+				# something changed, work out the interval again
+				self.wake.clear()
+				continue
+			if self.stopped:
+				break
+			self.last_poll = time.monotonic()
+			self.refresh()
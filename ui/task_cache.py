@@ -0,0 +1,68 @@
+"""Versioned on-disk copy of the users tasks, used to populate the tree before the server answers"""
+
+import json
+import logging
+import os
+
+from ui import app
+from ui import tasks
+
+
+log = logging.getLogger("task_cache")
+# bump whenever the layout of the cache file changes, older files are then ignored
+version = 1
+filename = "tasks.json"
+
+
+def cache_path():
+	return os.path.join(app.data_dir, filename)
+
+
+def load(owner="", path=None):
+	"""Return the cached tasks, or an empty list if there is no usable cache.
+
+	args:
+		owner (str): API user the cache has to belong to, so switching accounts never shows somebody elses tasks.
+	"""
+	path = path or cache_path()
+	try:
+		with open(path, "r", encoding="UTF8") as f:
+			contents = json.load(f)
+	except FileNotFoundError:
+		return []
+	except (OSError, ValueError):
+		log.exception("While reading the task cache")
+		return []
+	if not isinstance(contents, dict) or contents.get("version") != version:
+		log.info("Ignoring task cache with an unknown version")
+		return []
+	if contents.get("owner", "") != owner:
+		return []
+	return [tasks.Task(**fields) for fields in contents.get("tasks", [])]
+
+
+def save(task_list, owner="", path=None):
+	path = path or cache_path()
+	contents = {
+		"version": version,
+		"owner": owner,
+		"tasks": [tasks.Task.from_api(task).to_dict() for task in task_list],
+	}
+	# write to a temporary file first so a crash never leaves a half written cache behind
+	tmp_path = path + ".tmp"
+	try:
+		with open(tmp_path, "w", encoding="UTF8") as f:
+			json.dump(contents, f)
+		os.replace(tmp_path, path)
+	except OSError:
+		log.exception("While writing the task cache")
+		return False
+	return True
+
+
+def clear(path=None):
+	path = path or cache_path()
+	try:
+		os.remove(path)
+	except FileNotFoundError:
+		pass
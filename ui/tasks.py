@@ -0,0 +1,434 @@
+import bisect
+import datetime
+import json
+import threading
+import time
+
+from ui import search
+
+
+# fields most tasks have, kept in slots of their own. Anything else goes into a dict, only created when there is such a field
+hot_fields = (
+	"_id", "id", "type", "text", "notes", "tags", "value", "priority", "attribute", "completed",
+	"createdAt", "updatedAt", "userId", "checklist", "collapseChecklist", "reminders", "challenge", "group", "byHabitica",
+	"up", "down", "counterUp", "counterDown", "history", "frequency", "everyX", "startDate", "repeat", "streak",
+	"daysOfMonth", "weeksOfMonth", "isDue", "nextDue", "yesterDaily", "date",
+)
+# field name -> the slot holding it, "id" would clash with the id property
+slot_names = {name: "id_field" if name == "id" else name for name in hot_fields}
+
+
+class Task:
+	"""A plain local copy of a habitica task.
+
+	Tasks coming from the API and tasks loaded from the on-disk cache are both converted to this, so the rest of the UI never has to care where a task came from.
+	Every field is readable as an attribute. The common ones are stored in slots, so a typical task carries no dict at all, which adds up with thousands of tasks.
+	"""
+
+	__slots__ = tuple(slot_names.values()) + ("extra",)
+
+	def __init__(self, **fields):
+		object.__setattr__(self, "extra", None)
+		for name, value in fields.items():
+			setattr(self, name, value)
+
+	def __getattr__(self, name):
+		# only called for fields that aren't set
+		if name in slot_names or name == "extra":
+			raise AttributeError(name)
+		extra = self.extra
+		if extra and name in extra:
+			return extra[name]
+		raise AttributeError(name)
+
+	def __setattr__(self, name, value):
+		slot = slot_names.get(name)
+		if slot:
+			object.__setattr__(self, slot, value)
+			return
+		if self.extra is None:
+			object.__setattr__(self, "extra", {})
+		self.extra[name] = value
+
+	def __delattr__(self, name):
+		slot = slot_names.get(name)
+		if slot:
+			object.__delattr__(self, slot)
+			return
+		try:
+			del self.extra[name]
+		except (KeyError, TypeError):
+			raise AttributeError(name) from None
+
+	# so copy and pickle work without a __dict__
+	def __getstate__(self):
+		return self.to_dict()
+
+	def __setstate__(self, fields):
+		self.__init__(**fields)
+
+	@classmethod
+	def from_api(cls, obj):
+		"""Build a task from an API task object, a dict, or another Task"""
+		if isinstance(obj, cls):
+			return obj
+		if isinstance(obj, dict):
+			return cls(**obj)
+		return cls(**json.loads(obj.to_json()))
+
+	@property
+	def id(self):
+		return self.get("_id") or self.get("id")
+
+	def get(self, name, default=None):
+		slot = slot_names.get(name)
+		if slot:
+			return getattr(self, slot, default)
+		if self.extra:
+			return self.extra.get(name, default)
+		return default
+
+	def reset(self, other):
+		"""Replace every field with those of the task other"""
+		for slot in slot_names.values():
+			value = getattr(other, slot, _missing)
+			if value is not _missing:
+				object.__setattr__(self, slot, value)
+			elif hasattr(self, slot):
+				object.__delattr__(self, slot)
+		object.__setattr__(self, "extra", dict(other.extra) if other.extra else None)
+
+	def to_dict(self):
+		fields = {}
+		for name, slot in slot_names.items():
+			value = getattr(self, slot, _missing)
+			if value is not _missing:
+				fields[name] = value
+		if self.extra:
+			fields.update(self.extra)
+		return fields
+
+	def to_json(self):
+		return json.dumps(self.to_dict(), indent=2)
+
+	def __str__(self):
+		return self.get("text", "")
+
+	def __repr__(self):
+		return f"<Task {self.type} {self.id}>"
+
+
+def from_api(objects):
+	return [Task.from_api(obj) for obj in objects]
+
+
+def task_differs(old, new):
+	"""Whether the local copy old no longer matches the server copy new.
+
+	A different updatedAt settles it quickly, but local changes that never reached the server (e.g. a rejected edit) leave updatedAt alone, so equal timestamps still mean comparing every field.
+	"""
+	old_updated = getattr(old, "updatedAt", None)
+	new_updated = getattr(new, "updatedAt", None)
+	if old_updated and new_updated and old_updated != new_updated:
+		return True
+	return old.to_dict() != new.to_dict()
+
+
+def score_changes(task, direction):
+	"""The fields the server is expected to change when task is scored in direction ("up" or "down")"""
+	if task.type in ("daily", "todo"):
+		return {"completed": direction == "up"}
+	if task.type == "habit":
+		counter = "counterUp" if direction == "up" else "counterDown"
+		return {counter: task.get(counter, 0) + 1}
+	return {}  # rewards don't change when bought
+
+
+def due_date(task):
+	"""When task is next due as an aware datetime, None if it has no due date.
+
+	Todos carry an ISO date, dailies a list of upcoming days in whatever format the server felt like.
+	"""
+	value = task.get("date")
+	if task.type == "daily":
+		next_due = task.get("nextDue") or []
+		value = next_due[0] if next_due else None
+	if not value or not isinstance(value, str):
+		return
+	try:
+		when = datetime.datetime.fromisoformat(value)
+	except ValueError:
+		try:
+			# e.g. "Mon Jan 01 2024 00:00:00 GMT-0500"
+			when = datetime.datetime.strptime(value[:24], "%a %b %d %Y %H:%M:%S")
+		except ValueError:
+			return
+	if when.tzinfo is None:
+		when = when.astimezone()
+	return when.astimezone(datetime.timezone.utc)
+
+
+_missing = object()
+
+
+class TaskStore:
+	"""The clients copy of the users tasks.
+
+	Server responses to individual actions are applied as patches, so only the periodic integrity check has to download everything again.
+	Besides the tasks by id, the store keeps indexes by type, completion, tag and due date that are updated along with every patch, so lookups never scan every task.
+	Change tasks through the store (patch, update, apply_score) rather than setting attributes directly, or the indexes go stale.
+	"""
+
+	def __init__(self):
+		self.lock = threading.RLock()
+		self.tasks = {}
+		# type -> {id: task}, in the same order as self.tasks
+		self.by_type = {}
+		# (type, completed) -> {id: task}, so the incomplete dailies don't mean going through every todo as well
+		self.by_completion = {}
+		# tag id -> {id: task}
+		self.by_tag = {}
+		# sorted (due, id) pairs, plus each tasks entry so it can be found again
+		self.by_due = []
+		self.due_dates = {}
+		self.search_index = search.SearchIndex()
+		# monotonic time of the last full download, None if we never had one
+		self.last_full_sync = None
+
+	def replace(self, task_list, synced=True):
+		"""Swap in a complete task list, e.g. after a full download.
+
+		args:
+			synced (bool): Whether task_list came straight from the server. Cached copies pass False so an integrity check still happens soon.
+		"""
+		task_list = from_api(task_list)
+		with self.lock:
+			self.tasks = {task.id: task for task in task_list}
+			self.reindex()
+			self.search_index.clear()
+			for task in task_list:
+				self.search_index.update(task)
+			if synced:
+				self.last_full_sync = time.monotonic()
+
+	def sync(self, task_list):
+		"""Bring the store in line with a full download, reporting what actually changed.
+
+		Tasks are compared with task_differs. Existing Task objects are kept and refreshed in place, so references held by the UI stay valid.
+
+		returns:
+			(changed, removed, reordered): the tasks that are new or were modified, the tasks that went away and the set of task types whose order changed.
+		"""
+		task_list = from_api(task_list)
+		with self.lock:
+			old = self.tasks
+			synced = {}
+			changed = []
+			# tasks whose fields are about to change in any way, even with the same updatedAt
+			reindexed = []
+			for task in task_list:
+				existing = old.get(task.id)
+				if existing is None:
+					changed.append(task)
+					reindexed.append(task)
+					synced[task.id] = task
+					continue
+				if task_differs(existing, task):
+					changed.append(existing)
+					reindexed.append(existing)
+				# always reset to the servers copy, anything still pending is reapplied by the caller
+				existing.reset(task)
+				synced[task.id] = existing
+			removed = [task for task_id, task in old.items() if task_id not in synced]
+			self.tasks = synced
+			self.reindex()
+			# only tasks whose fields were actually replaced can have different words
+			for task in reindexed:
+				self.search_index.update(task)
+			for task in removed:
+				self.search_index.remove(task.id)
+			self.last_full_sync = time.monotonic()
+		reordered = set()
+		for type in {task.type for task in synced.values()}:
+			before = [task_id for task_id, task in old.items() if task.type == type and task_id in synced]
+			after = [task_id for task_id, task in synced.items() if task.type == type and task_id in old]
+			if before != after:
+				reordered.add(type)
+		return changed, removed, reordered
+
+	def reindex(self):
+		"""Rebuild every index from scratch, only needed when the whole task list is swapped out"""
+		with self.lock:
+			self.by_type = {}
+			self.by_completion = {}
+			self.by_tag = {}
+			self.by_due = []
+			self.due_dates = {}
+			for task in self.tasks.values():
+				self.by_type.setdefault(task.type, {})[task.id] = task
+				self.index(task)
+
+	def index(self, task):
+		"""Add task to the indexes that depend on its fields. The type index is kept by whoever adds or removes the task"""
+		self.by_completion.setdefault((task.type, bool(task.get("completed"))), {})[task.id] = task
+		for tag in task.get("tags") or []:
+			self.by_tag.setdefault(tag, {})[task.id] = task
+		due = due_date(task)
+		if due:
+			self.due_dates[task.id] = due
+			bisect.insort(self.by_due, (due, task.id))
+
+	def unindex(self, task):
+		self.by_completion.get((task.type, bool(task.get("completed"))), {}).pop(task.id, None)
+		for tag in task.get("tags") or []:
+			tagged = self.by_tag.get(tag)
+			if tagged is not None:
+				tagged.pop(task.id, None)
+				if not tagged:
+					del self.by_tag[tag]
+		due = self.due_dates.pop(task.id, None)
+		if due:
+			index = bisect.bisect_left(self.by_due, (due, task.id))
+			if index < len(self.by_due) and self.by_due[index] == (due, task.id):
+				del self.by_due[index]
+
+	def all(self):
+		with self.lock:
+			return list(self.tasks.values())
+
+	def get(self, task_id):
+		with self.lock:
+			return self.tasks.get(task_id)
+
+	def of_type(self, type):
+		"""Tasks of one type (e.g. "todo"), in display order"""
+		with self.lock:
+			return list(self.by_type.get(type, {}).values())
+
+	def incomplete(self, type=None):
+		return self.with_completion(False, type)
+
+	def completed(self, type=None):
+		return self.with_completion(True, type)
+
+	def with_completion(self, completed, type=None):
+		with self.lock:
+			if type is not None:
+				return list(self.by_completion.get((type, completed), {}).values())
+			return [task for (_, done), group in self.by_completion.items() if done == completed for task in group.values()]
+
+	def with_tag(self, tag):
+		"""Tasks carrying the tag with the given id"""
+		with self.lock:
+			return list(self.by_tag.get(tag, {}).values())
+
+	def due_before(self, when):
+		"""Tasks due before when (an aware datetime), soonest first"""
+		with self.lock:
+			end = bisect.bisect_left(self.by_due, (when, ""))
+			return [self.tasks[task_id] for due, task_id in self.by_due[:end]]
+
+	def search(self, query):
+		"""Tasks matching query as the user typed it, in display order. None if query is blank"""
+		with self.lock:
+			ids = self.search_index.search(query)
+			if ids is None:
+				return
+			return [task for task in self.tasks.values() if task.id in ids]
+
+	def set_tag_names(self, names):
+		"""Let tasks be found by the names of their tags.
+
+		args:
+			names (dict): Tag names by tag id.
+		"""
+		with self.lock:
+			self.search_index.tag_names = dict(names)
+			for tagged in list(self.by_tag.values()):
+				for task in list(tagged.values()):
+					self.search_index.update(task)
+
+	def add(self, task):
+		"""Add a newly created task, at the top like the website does"""
+		task = Task.from_api(task)
+		with self.lock:
+			self.remove(task.id)
+			self.tasks = {task.id: task, **self.tasks}
+			self.by_type[task.type] = {task.id: task, **self.by_type.get(task.type, {})}
+			self.index(task)
+			self.search_index.update(task)
+		return task
+
+	def update(self, task):
+		"""Merge new fields into an existing task, keeping the same object so references held by the UI stay valid"""
+		task = Task.from_api(task)
+		with self.lock:
+			if task.id not in self.tasks:
+				return self.add(task)
+			self.patch(task.id, task.to_dict())
+			return self.tasks[task.id]
+
+	def patch(self, task_id, changes):
+		"""Set some fields of a task, keeping the indexes up to date.
+
+		Fields given as _missing are removed.
+
+		returns:
+			The previous values of everything touched, which can be passed to patch again to undo it. None if there is no such task.
+		"""
+		with self.lock:
+			task = self.tasks.get(task_id)
+			if not task:
+				return
+			undo = {key: task.get(key, _missing) for key in changes}
+			old_type = task.type
+			self.unindex(task)
+			for key, value in changes.items():
+				if value is not _missing:
+					setattr(task, key, value)
+				elif task.get(key, _missing) is not _missing:
+					delattr(task, key)
+			self.index(task)
+			self.search_index.update(task)
+			if task.type != old_type:
+				# rare enough to just rebuild the type index in order
+				self.by_type = {}
+				for each in self.tasks.values():
+					self.by_type.setdefault(each.type, {})[each.id] = each
+			return undo
+
+	def score(self, task_id, direction):
+		"""Apply the change the server is expected to make when a task is scored in direction ("up" or "down").
+
+		returns:
+			What to pass to patch to take it back if the server disagrees.
+		"""
+		with self.lock:
+			task = self.tasks.get(task_id)
+			if not task:
+				return
+			return self.patch(task_id, score_changes(task, direction))
+
+	def remove(self, task_id):
+		with self.lock:
+			task = self.tasks.pop(task_id, None)
+			if task:
+				self.by_type.get(task.type, {}).pop(task_id, None)
+				self.unindex(task)
+				self.search_index.remove(task_id)
+			return task
+
+	def apply_score(self, task_id, data):
+		"""Patch a task with the data returned by the score endpoint"""
+		with self.lock:
+			task = self.tasks.get(task_id)
+			if not task:
+				return
+			delta = data.get("delta")
+			if delta is not None:
+				self.patch(task_id, {"value": task.get("value", 0) + delta})
+			return task
+
+	def needs_integrity_check(self, interval):
+		with self.lock:
+			return self.last_full_sync is None or time.monotonic() - self.last_full_sync > interval
@@ -0,0 +1,184 @@
+"""Lightweight spans for finding out where time goes, written out in the Chrome trace format (load it in chrome://tracing or ui.perfetto.dev).
+
+Off unless enable is called, which app.init does when running with --debug. While off, span and action hand back a shared do-nothing context manager, and traced and wrap return the function untouched.
+"""
+
+import collections
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+
+
+enabled = False
+# completed trace events, in the Chrome trace format
+events = []
+# events are dropped past this many, so a long session can't eat all the memory
+max_events = 200000
+dropped = 0
+thread_names = {}
+lock = threading.Lock()
+origin = time.perf_counter()
+# the user action whatever is running now happens on behalf of, carried across threads by wrap
+current_action = contextvars.ContextVar("current_action", default=None)
+# the most recent actions, for report
+actions = collections.deque(maxlen=50)
+null_span = contextlib.nullcontext()
+
+
+def enable():
+	global enabled, origin
+	origin = time.perf_counter()
+	enabled = True
+
+
+class Action:
+	"""Something the user did, e.g. marking a task up, and every span that ran because of it"""
+
+	def __init__(self, name):
+		self.name = name
+		self.started = time.perf_counter()
+		self.finished = self.started
+		# (name, category, start, duration) with times from time.perf_counter
+		self.spans = []
+
+	@property
+	def latency(self):
+		"""Seconds from the action starting to the last span it caused ending"""
+		return self.finished - self.started
+
+
+class Span:
+	def __init__(self, name, category="app", args=None):
+		self.name = name
+		self.category = category
+		self.args = args
+
+	def __enter__(self):
+		self.start = time.perf_counter()
+		return self
+
+	def __exit__(self, *exc):
+		end = time.perf_counter()
+		record(self.name, self.category, self.start, end, self.args)
+
+
+def record(name, category, start, end, args=None):
+	"""Add a complete event that ran from start to end (time.perf_counter values) on the current thread"""
+	global dropped
+	thread = threading.current_thread()
+	event = {
+		"name": name,
+		"cat": category,
+		"ph": "X",
+		"ts": (start - origin) * 1000000,
+		"dur": (end - start) * 1000000,
+		"pid": os.getpid(),
+		"tid": thread.ident,
+	}
+	if args:
+		event["args"] = args
+	action = current_action.get()
+	with lock:
+		thread_names[thread.ident] = thread.name
+		if len(events) < max_events:
+			events.append(event)
+		else:
+			dropped += 1
+		if action and category != "action":
+			action.spans.append((name, category, start, end - start))
+			action.finished = max(action.finished, end)
+
+
+def span(name, category="app", **args):
+	"""Context manager timing the code inside it"""
+	if not enabled:
+		return null_span
+	return Span(name, category, args)
+
+
+@contextlib.contextmanager
+def action(name):
+	"""Trace everything done inside, including work it hands to other threads through wrap, as one user action"""
+	if not enabled:
+		yield
+		return
+	current = Action(name)
+	with lock:
+		actions.append(current)
+	token = current_action.set(current)
+	try:
+		with Span(name, "action"):
+			yield current
+	finally:
+		current_action.reset(token)
+
+
+def traced(name=None, category="app"):
+	"""Decorator putting a span around every call of the decorated function"""
+	def decorator(func):
+		label = name or func.__qualname__
+		@functools.wraps(func)
+		def wrapper(*args, **kwargs):
+			if not enabled:
+				return func(*args, **kwargs)
+			with Span(label, category):
+				return func(*args, **kwargs)
+		return wrapper
+	return decorator
+
+
+def wrap(func, name=None, category="app"):
+	"""Prepare func to run on another thread, keeping the current action and timing both the run and how long it waited to start"""
+	if not enabled:
+		return func
+	context = contextvars.copy_context()
+	label = name or getattr(func, "__qualname__", repr(func))
+	queued = time.perf_counter()
+	def run(*args, **kwargs):
+		started = time.perf_counter()
+		with Span(label, category, {"waited_ms": round((started - queued) * 1000, 3)}):
+			return func(*args, **kwargs)
+	@functools.wraps(func)
+	def wrapper(*args, **kwargs):
+		# a copy per call, a context can't be entered twice at once
+		return context.copy().run(run, *args, **kwargs)
+	return wrapper
+
+
+def write(path):
+	"""Save everything traced so far as a Chrome trace file"""
+	with lock:
+		metadata = [
+			{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": ident, "args": {"name": name}}
+			for ident, name in thread_names.items()
+		]
+		trace_events = metadata + list(events)
+	with open(path, "w", encoding="UTF8") as f:
+		json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms", "otherData": {"dropped": dropped}}, f)
+
+
+def report(limit=20):
+	"""Human readable latency breakdown of the most recent actions, newest first"""
+	with lock:
+		recent = list(actions)
+	if not recent:
+		return "Nothing traced yet. Mark a task up or down to record an action."
+	lines = []
+	for current in reversed(recent):
+		with lock:
+			spans = sorted(current.spans, key=lambda span: span[2])
+		lines.append(f"{current.name}: {current.latency * 1000:.1f} ms")
+		by_category = collections.Counter()
+		for name, category, start, duration in spans:
+			by_category[category] += duration
+		if by_category:
+			lines.append("  " + ", ".join(f"{category} {duration * 1000:.1f} ms" for category, duration in by_category.most_common()))
+		for name, category, start, duration in spans[:limit]:
+			lines.append(f"  +{(start - current.started) * 1000:.1f} ms  {name} ({category}) {duration * 1000:.1f} ms")
+		if len(spans) > limit:
+			lines.append(f"  and {len(spans) - limit} more")
+	return "\n".join(lines)
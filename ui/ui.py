@@ -5,6 +5,8 @@ from ui import app
 from ui import config
 from ui import dialogs
 from ui import habitica_functions as habitica
+from ui import trace
+from ui import utils
 
 
 label_flags = wx.ALL | wx.ALIGN_CENTER_VERTICAL
@@ -98,15 +100,24 @@ class LoginDialog(wx.Dialog):
 		config.config["api_user"] = api_user
 		config.config["api_key"] = api_key
 		config.config.write()
-		success = habitica.login(self, username, password)
-		if not success:
+		# the server may take a while, or ask us to come back later
+		self.login_btn.Disable()
+		utils.call_when_done(habitica.login(username, password), self.on_logged_in, username)
+
+	def on_logged_in(self, future, username):
+		if not self or not self.IsModal():
+			return  # closed while we were waiting
+		self.login_btn.Enable()
+		exc = future.exception()
+		if exc:
+			if not habitica.login_failed(self, exc):
+				raise exc
 			self.username.SetFocus()
 			return
-		else:
-			if self.remember_me.IsChecked():
-				config.config["username"] = username
-				config.config.write()
-		self.EndModal(success)
+		if self.remember_me.IsChecked():
+			config.config["username"] = username
+			config.config.write()
+		self.EndModal(True)
 
 
 class CronDialog(wx.Dialog):
@@ -134,18 +145,19 @@ class CronDialog(wx.Dialog):
 		btn_sizer.Realize()
 		self.SetAffirmativeId(self.done_btn.GetId())
 
-	def complete_selected(self):
-		for ctrl in self.checkboxes:
-			if not ctrl.IsChecked() or not hasattr(ctrl, "task"):
-				continue
-			# do not pass as a parent, as we only call this function after this dialog has been closed
-			habitica.score_task(None, ctrl.task, up=True, update_ui=False)
-		print(habitica.cron())  # todo: currently we're eating the notifications
+	def get_selected(self):
+		"""The dailies checked off as done"""
+		return [ctrl.task for ctrl in self.checkboxes if ctrl.IsChecked() and hasattr(ctrl, "task")]
 
 class TaskTreeFrame(wx.Frame):
-	def __init__(self, parent=None, title="Task Viewer", cached_tasks=[], **kwargs):
+	def __init__(self, parent=None, title="Task Viewer", cached_tasks=[], refresh=True, **kwargs):
+		"""args:
+			cached_tasks (list): Tasks to show right away, typically from the on-disk cache.
+			refresh (bool): Download the tasks in the background once shown. Pass False when whoever created the frame is already fetching them.
+		"""
 		super().__init__(parent, title=title, **kwargs)
 		self.cached_tasks = cached_tasks
+		self.refresh = refresh
 		self.panel = wx.Panel(self)
 		self.descendants = []
 		self.setup_layout()
@@ -159,7 +171,10 @@ class TaskTreeFrame(wx.Frame):
 		self.main_sizer = wx.BoxSizer(wx.VERTICAL)
 		nb_sizer = wx.BoxSizer(wx.HORIZONTAL)
 		self.notebook = wx.Notebook(self.panel)
-		self.tasks_panel = TaskTreePanel(self.notebook)
+		if config.config.get("task_view") == "list":
+			self.tasks_panel = TaskListPanel(self.notebook)
+		else:
+			self.tasks_panel = TaskTreePanel(self.notebook)
 		self.notebook.AddPage(self.tasks_panel, "Tasks")
 		nb_sizer.Add(self.notebook, 0, control_flags, 5)
 		self.main_sizer.Add(nb_sizer, 1, wx.EXPAND)
@@ -169,6 +184,35 @@ class TaskTreeFrame(wx.Frame):
 		self.notebook.Bind(wx.EVT_NOTEBOOK_PAGE_CHANGED, self.on_notebook_page_changed)
 		#self.notebook.Bind(wx.EVT_NAVIGATION_KEY, self.on_notebook_navigation)
 		self.Bind(wx.EVT_NAVIGATION_KEY, self.on_navigation)
+		self.Bind(wx.EVT_ACTIVATE, self.on_activate)
+		self.Bind(wx.EVT_ICONIZE, self.on_iconize)
+		self.Bind(wx.EVT_CLOSE, self.on_close)
+		if app.debug:
+			trace_id = wx.NewIdRef()
+			self.Bind(wx.EVT_MENU, self.on_show_trace, id=trace_id)
+			self.SetAcceleratorTable(wx.AcceleratorTable([(wx.ACCEL_CTRL | wx.ACCEL_SHIFT, ord("D"), trace_id)]))
+
+	def on_show_trace(self, event):
+		dlg = TraceDialog(self)
+		dlg.ShowModal()
+		dlg.Destroy()
+
+	def on_activate(self, event):
+		# poll more often while we have focus
+		if habitica.poller:
+			habitica.poller.set_focused(event.GetActive())
+		event.Skip()
+
+	def on_iconize(self, event):
+		# and not at all while minimized
+		if habitica.poller:
+			habitica.poller.set_minimized(event.IsIconized())
+		event.Skip()
+
+	def on_close(self, event):
+		habitica.stop_sync()
+		app.write_trace()
+		event.Skip()
 
 	def on_notebook_page_changed(self, event):
 		selected_page = self.notebook.GetSelection()
@@ -223,11 +267,17 @@ class BasePanel(wx.Panel):
 		pass  # implement in subclass
 
 
-class  TaskTreePanel(BasePanel):
+class BaseTaskPanel(BasePanel):
+	"""Menus and actions shared by every view of the task list.
+
+	Subclasses provide the control itself, plus get_focused_item_data and update_task_types.
+	"""
+
 	def __init__(self, parent):
+		# only tasks matching this are shown, see on_search
+		self.search_query = ""
 		super().__init__(parent)
-		self.add_task_types()
-		self.tree_ctrl.SetFocus()
+		self.load_tasks()
 
 	def init_menus(self):
 		self.new_menu = wx.Menu()
@@ -241,17 +291,16 @@ class  TaskTreePanel(BasePanel):
 		self.copy_json_item = self.task_context_menu.Append(wx.ID_ANY, "Copy JSON")
 		self.delete_item = self.task_context_menu.Append(wx.ID_ANY, "Delete")
 
-	def setup_layout(self):
-		self.main_sizer = wx.BoxSizer(wx.VERTICAL)
-		self.tree_ctrl = wx.TreeCtrl(self)
-		self.root = self.tree_ctrl.AddRoot("Task Types")
-		self.main_sizer.Add(self.tree_ctrl, 0, control_flags, 5)
-		self.new_button = wx.Button(self, label="&New")
-		self.main_sizer.Add(self.new_button, 0, control_flags, 5)
+	def add_search_box(self):
+		search_label = wx.StaticText(self, label="&Search:")
+		self.search_box = wx.TextCtrl(self)
+		search_sizer = wx.BoxSizer(wx.HORIZONTAL)
+		search_sizer.Add(search_label, 0, label_flags, 5)
+		search_sizer.Add(self.search_box, 1, control_flags, 5)
+		self.main_sizer.Add(search_sizer, 0, wx.EXPAND)
 
 	def bind_events(self):
-		self.tree_ctrl.Bind(wx.EVT_TREE_ITEM_ACTIVATED, self.on_item_activate)
-		self.tree_ctrl.Bind(wx.EVT_TREE_ITEM_MENU, self.on_context_menu)
+		self.search_box.Bind(wx.EVT_TEXT, self.on_search)
 		self.new_button.Bind(wx.EVT_BUTTON, self.on_new)
 		self.Bind(wx.EVT_MENU, self.on_mark_up, self.mark_up_item)
 		self.Bind(wx.EVT_MENU, self.on_mark_down, self.mark_down_item)
@@ -263,6 +312,14 @@ class  TaskTreePanel(BasePanel):
 	def on_set_focus(self, event):
 		self.SetFocusIgnoringChildren()
 
+	def on_search(self, event):
+		self.search_query = self.search_box.GetValue().strip()
+		self.show_search_results()
+
+	def show_search_results(self):
+		"""Show only the tasks matching the search box, or all of them when it's empty"""
+		self.update_task_types(**habitica.search_tasks(self.search_query))
+
 	def on_new(self, event):
 		self.PopupMenu(self.new_menu)
 
@@ -283,14 +340,16 @@ class  TaskTreePanel(BasePanel):
 		if not task:
 			event.Skip()
 			return
-		habitica.score_task(self, task, up=True)
+		with trace.action("mark up"):
+			habitica.score_task(self, task, up=True)
 
 	def on_mark_down(self, event):
 		task = self.get_focused_item_data()
 		if not task:
 			event.Skip()
 			return
-		habitica.score_task(self, task, up=False)
+		with trace.action("mark down"):
+			habitica.score_task(self, task, up=False)
 
 	def on_item_activate(self, event):
 		task = self.get_focused_item_data()
@@ -299,7 +358,7 @@ class  TaskTreePanel(BasePanel):
 		dlg = self.dialog_from_type(task.type)
 		if not dlg:  # we're on a tree view or item that is not a task
 			return
-		dlg = dlg(self, data=task.__dict__)
+		dlg = dlg(self, data=task.to_dict())
 		res = dlg.ShowModal()
 		if res in [wx.ID_CLOSE, wx.ID_CANCEL]:
 			return
@@ -322,8 +381,11 @@ class  TaskTreePanel(BasePanel):
 			print("no data")
 			event.Skip()
 			return
-		habitica.delete_task(self, task)
-
+		confirmation = dialogs.question(self, "Delete task?", "Are you sure you want to delete the selected "+task.type+"?", warning=True)
+		if confirmation != wx.ID_YES:
+			return
+		with trace.action("delete"):
+			habitica.delete_task(self, task)
 
 	def on_context_menu(self, event):
 		task = self.get_focused_item_data()
@@ -363,46 +425,153 @@ class  TaskTreePanel(BasePanel):
 			dlg = RewardDialog
 		return dlg
 
+	def load_tasks(self):
+		frame = self.GetParent().GetParent().GetParent()
+		cached_tasks = frame.cached_tasks or []
+		if cached_tasks:
+			# show whatever we have on disk immediately, the server copy replaces it once it arrives
+			habitica.set_tasks(cached_tasks)
+			# from the store, which also has the changes made offline last time
+			self.update_task_types(**habitica.group_tasks(habitica.store.all()))
+		if frame.refresh:
+			habitica.update_tasks(self)
+
+	def add_mark_down_to_menu(self):
+		if not self.task_context_menu.FindItemById(self.mark_down_item.GetId()):
+			self.task_context_menu.Insert(1, self.mark_down_item)
+
+	def remove_mark_down_from_menu(self):
+		if self.task_context_menu.FindItemById(self.mark_down_item.GetId()):
+			self.task_context_menu.Remove(self.mark_down_item)
+
+	def get_focused_item_data(self):
+		pass  # implement in subclass
+
+	def get_focused_task_id(self):
+		task = self.get_focused_item_data()
+		if task:
+			return task.id
+
+	def update_task_types(self, clear_children=True, **kwargs):
+		pass  # implement in subclass
+
+
+class  TaskTreePanel(BaseTaskPanel):
+	def __init__(self, parent):
+		# maps task ids to their node in the tree, so refreshes only touch what changed
+		self.task_nodes = {}
+		super().__init__(parent)
+		self.tree_ctrl.SetFocus()
+
+	def setup_layout(self):
+		self.main_sizer = wx.BoxSizer(wx.VERTICAL)
+		self.add_search_box()
+		self.tree_ctrl = wx.TreeCtrl(self)
+		self.root = self.tree_ctrl.AddRoot("Task Types")
+		self.add_task_types()
+		self.main_sizer.Add(self.tree_ctrl, 0, control_flags, 5)
+		self.new_button = wx.Button(self, label="&New")
+		self.main_sizer.Add(self.new_button, 0, control_flags, 5)
+
+	def bind_events(self):
+		super().bind_events()
+		self.tree_ctrl.Bind(wx.EVT_TREE_ITEM_ACTIVATED, self.on_item_activate)
+		self.tree_ctrl.Bind(wx.EVT_TREE_ITEM_MENU, self.on_context_menu)
+
 	def add_task_types(self):
 		"""Add each task type to the tree as a child of the root node"""
 		for task_type in habitica.valid_task_types:
 			item = self.tree_ctrl.AppendItem(self.root, task_type)
 			setattr(self, task_type, item)
-		cached_tasks = self.GetParent().GetParent().GetParent().cached_tasks or []
-		habitica.update_tasks(self, tasks_dict=cached_tasks)
 
+	@trace.traced("update_task_types", "ui")
 	def update_task_types(self, clear_children=True, **kwargs):
 		"""Update first level tree view items.
 
+		Existing nodes are matched to tasks by id and only inserted, removed, moved or relabeled when they differ, so focus and scroll position survive a refresh.
+
 		args:
-			clear_children (bool): Delete pre-existing children under each type node.
-			kwargs (dict): Tree view entries in the form {type, items}, where type can be any of habitica.valid_task_types and items is a list of strings to be displayed.
+			clear_children (bool): Remove nodes for tasks that are no longer present under each type node.
+			kwargs (dict): Tree view entries in the form {type, items}, where type can be any of habitica.valid_task_types and items is a list of tasks to be displayed.
 		"""
+		focused_id = self.get_focused_task_id()
 		self.tree_ctrl.Freeze()
-		for root, items in kwargs.items():
-			if not root in habitica.valid_task_types:
-				print(f"{root} not found in tree")
+		try:
+			for root, items in kwargs.items():
+				if not root in habitica.valid_task_types:
+					print(f"{root} not found in tree")
+					continue
+				task_type = getattr(self, root, None)
+				if not task_type:
+					print("error")
+					continue
+				self.reconcile_children(task_type, items, remove_stale=clear_children)
+		finally:
+			self.tree_ctrl.Thaw()
+		self.restore_focus(focused_id)
+
+	def get_children(self, node):
+		children = []
+		child, cookie = self.tree_ctrl.GetFirstChild(node)
+		while child.IsOk():
+			children.append(child)
+			child, cookie = self.tree_ctrl.GetNextChild(node, cookie)
+		return children
+
+	def get_task_id(self, node):
+		data = self.tree_ctrl.GetItemData(node)
+		if data and "item" in data:
+			return data["item"].id
+
+	def reconcile_children(self, parent, items, remove_stale=True):
+		"""Make the children of parent match items, in order, touching as few nodes as possible"""
+		wanted = {item.id for item in items}
+		children = []
+		for child in self.get_children(parent):
+			task_id = self.get_task_id(child)
+			if task_id in wanted or not remove_stale:
+				children.append(child)
 				continue
-			task_type = getattr(self, root, None)
-			if not task_type:
-				print("error")
+			self.task_nodes.pop(task_id, None)
+			self.tree_ctrl.Delete(child)
+		previous = None
+		position = 0
+		for item in items:
+			label = str(item)
+			data = {"item": item}
+			node = self.task_nodes.get(item.id)
+			if node and position < len(children) and children[position] == node:
+				# already in the right place, so at most the label and payload need updating
+				position += 1
+				if self.tree_ctrl.GetItemText(node) != label:
+					self.tree_ctrl.SetItemText(node, label)
+				self.tree_ctrl.SetItemData(node, data)
+				previous = node
 				continue
-			if clear_children:
-				self.tree_ctrl.DeleteChildren(task_type)
-			for item in items:
-				self.tree_ctrl.AppendItem(task_type, str(item), data={"item": item})
-		self.tree_ctrl.Thaw()
-
-	def add_mark_down_to_menu(self):
-		if not self.task_context_menu.FindItemById(self.mark_down_item.GetId()):
-			self.task_context_menu.Insert(1, self.mark_down_item)
+			if node:
+				# exists elsewhere, so move it by deleting and reinserting at the right spot
+				if node in children:
+					children.remove(node)
+				self.tree_ctrl.Delete(node)
+			if previous is None:
+				node = self.tree_ctrl.PrependItem(parent, label, data=data)
+			else:
+				node = self.tree_ctrl.InsertItem(parent, previous, label, data=data)
+			self.task_nodes[item.id] = node
+			previous = node
 
-	def remove_mark_down_from_menu(self):
-		if self.task_context_menu.FindItemById(self.mark_down_item.GetId()):
-			self.task_context_menu.Remove(self.mark_down_item)
+	def restore_focus(self, task_id):
+		"""Put focus back on a task whose node was recreated while reconciling"""
+		if not task_id or self.get_focused_task_id() == task_id:
+			return
+		node = self.task_nodes.get(task_id)
+		if node:
+			self.tree_ctrl.SelectItem(node)
 
 	def get_focused_item_data(self):
 		item = self.tree_ctrl.GetFocusedItem()
+		if not item.IsOk():
+			return
 		data = self.tree_ctrl.GetItemData(item)
 		if data and "item" in data:
 			return data["item"]
@@ -412,6 +581,160 @@ class  TaskTreePanel(BasePanel):
 		self.tree_ctrl.SetItemText(item, new_text)
 
 
+class VirtualTaskList(wx.ListCtrl):
+	"""List control that asks for row text on demand instead of holding an item per task"""
+
+	def __init__(self, parent):
+		super().__init__(parent, style=wx.LC_REPORT | wx.LC_VIRTUAL | wx.LC_SINGLE_SEL)
+		self.InsertColumn(0, "Task", width=300)
+		self.InsertColumn(1, "Type")
+		# tasks, with a string heading the tasks of each type
+		self.rows = []
+		self.header_attr = wx.ItemAttr()
+		font = self.GetFont()
+		font.MakeBold()
+		self.header_attr.SetFont(font)
+
+	def set_rows(self, rows):
+		self.rows = rows
+		self.SetItemCount(len(rows))
+		if rows:
+			# only rows on screen are actually redrawn
+			self.RefreshItems(0, len(rows) - 1)
+
+	def OnGetItemText(self, item, column):
+		if item >= len(self.rows):
+			return ""
+		task = self.rows[item]
+		if isinstance(task, str):
+			return task if column == 0 else ""
+		if column == 0:
+			return str(task)
+		return task.type
+
+	def OnGetItemAttr(self, item):
+		if item < len(self.rows) and isinstance(self.rows[item], str):
+			return self.header_attr
+
+
+class TaskListPanel(BaseTaskPanel):
+	"""Virtual view of every task, for accounts with more tasks than the tree handles comfortably.
+
+	Tasks are grouped under a header row per type, and control+up/down jumps between the headers like moving between the type nodes of the tree.
+	"""
+
+	def __init__(self, parent):
+		# the latest tasks of each type, as handed to update_task_types
+		self.groups = {}
+		self.rows = []
+		self.row_index = {}
+		# row of each type header, in order
+		self.header_rows = []
+		super().__init__(parent)
+		self.list_ctrl.SetFocus()
+
+	def setup_layout(self):
+		self.main_sizer = wx.BoxSizer(wx.VERTICAL)
+		self.add_search_box()
+		self.list_ctrl = VirtualTaskList(self)
+		self.main_sizer.Add(self.list_ctrl, 1, control_flags, 5)
+		self.new_button = wx.Button(self, label="&New")
+		self.main_sizer.Add(self.new_button, 0, control_flags, 5)
+
+	def bind_events(self):
+		super().bind_events()
+		self.list_ctrl.Bind(wx.EVT_LIST_ITEM_ACTIVATED, self.on_item_activate)
+		# covers both right clicks and the applications key
+		self.list_ctrl.Bind(wx.EVT_CONTEXT_MENU, self.on_context_menu)
+		self.list_ctrl.Bind(wx.EVT_KEY_DOWN, self.on_list_key_down)
+
+	def on_list_key_down(self, event):
+		key = event.GetKeyCode()
+		if not event.ControlDown() or key not in (wx.WXK_UP, wx.WXK_DOWN) or not self.header_rows:
+			event.Skip()
+			return
+		index = self.list_ctrl.GetFocusedItem()
+		if key == wx.WXK_DOWN:
+			following = [row for row in self.header_rows if row > index]
+			target = following[0] if following else self.header_rows[-1]
+		else:
+			preceding = [row for row in self.header_rows if row < index]
+			target = preceding[-1] if preceding else self.header_rows[0]
+		self.focus_row(target)
+
+	def focus_row(self, index):
+		self.list_ctrl.Focus(index)
+		self.list_ctrl.Select(index)
+		self.list_ctrl.EnsureVisible(index)
+
+	@trace.traced("update_task_types", "ui")
+	def update_task_types(self, clear_children=True, **kwargs):
+		"""Replace the tasks of each type given, in the same form TaskTreePanel takes them. Types not given are left alone"""
+		focused_id = self.get_focused_task_id()
+		for root, items in kwargs.items():
+			if not root in habitica.valid_task_types:
+				print(f"{root} not found in list")
+				continue
+			self.groups[root] = list(items)
+		focused_index = self.list_ctrl.GetFocusedItem()
+		# keep a focused header on its type, the row it's at moves when the types above it change
+		focused_type = None
+		if focused_index in self.header_rows:
+			focused_type = habitica.valid_task_types[self.header_rows.index(focused_index)]
+		self.rows = []
+		self.header_rows = []
+		for task_type in habitica.valid_task_types:
+			items = self.groups.get(task_type, [])
+			self.header_rows.append(len(self.rows))
+			self.rows.append(f"{task_type} ({len(items)})")
+			self.rows.extend(items)
+		self.row_index = {task.id: index for index, task in enumerate(self.rows) if not isinstance(task, str)}
+		self.list_ctrl.set_rows(self.rows)
+		if focused_type:
+			index = self.header_rows[habitica.valid_task_types.index(focused_type)]
+		else:
+			index = self.row_index.get(focused_id)
+		if index is not None and index != focused_index:
+			self.focus_row(index)
+
+	def get_focused_item_data(self):
+		"""The focused task, None on a type header"""
+		index = self.list_ctrl.GetFocusedItem()
+		if 0 <= index < len(self.rows) and not isinstance(self.rows[index], str):
+			return self.rows[index]
+
+
+class TraceDialog(wx.Dialog):
+	"""Where the time went for the last few actions, available with control+shift+d when running with --debug"""
+
+	def __init__(self, parent, title="Trace"):
+		super().__init__(parent, title=title, style=wx.DEFAULT_DIALOG_STYLE | wx.RESIZE_BORDER)
+		self.setup_layout()
+
+	def setup_layout(self):
+		self.main_sizer = wx.BoxSizer(wx.VERTICAL)
+		report_label = wx.StaticText(self, label="&Latency of recent actions:")
+		self.report = wx.TextCtrl(self, value=trace.report(), size=(500, 300), style=wx.TE_MULTILINE | wx.TE_READONLY | wx.TE_DONTWRAP)
+		self.main_sizer.Add(report_label, 0, label_flags, 5)
+		self.main_sizer.Add(self.report, 1, control_flags, 5)
+		self.save_button = wx.Button(self, label="&Save Chrome trace")
+		self.save_button.Bind(wx.EVT_BUTTON, self.on_save)
+		self.main_sizer.Add(self.save_button, 0, control_flags, 5)
+		btn_sizer = wx.StdDialogButtonSizer()
+		self.close_btn = wx.Button(self, id=wx.ID_CLOSE)
+		btn_sizer.AddButton(self.close_btn)
+		btn_sizer.Realize()
+		self.main_sizer.Add(btn_sizer, 0, wx.EXPAND)
+		self.SetEscapeId(wx.ID_CLOSE)
+		self.SetSizerAndFit(self.main_sizer)
+		self.report.SetFocus()
+
+	def on_save(self, event):
+		path = app.write_trace()
+		if path:
+			dialogs.information(self, "Trace saved", f"The trace was written to {path}. Open it in chrome://tracing or ui.perfetto.dev.")
+
+
 class BaseTaskDialog(wx.Dialog):
 	def __init__(self, parent, title, data={}, include_reminders_box=True, include_checklist_box=True, **kwargs):
 		super().__init__(parent=parent, title=title, **kwargs)
@@ -605,29 +928,74 @@ def start():
 	#dlg = HabitDialog(None)
 	#dlg.ShowModal()
 	dlg = LoginDialog(None)
+	# runs once the modal loop is processing events, i.e. the dialog is on screen
+	wx.CallAfter(app.mark, "login dialog")
 	result = dlg.ShowModal()
 	dlg.Destroy()
+	# includes the time spent typing
+	app.mark("login")
 	if result == True:
-		user = habitica.get_user()
-		if not user:
-			app.exit()
-		if user and user.needsCron:
-			tasks = habitica.get_tasks()
-			if not tasks:
-				app.exit()
-			incomplete = habitica.get_incomplete_dailies(tasks)
-			if len(incomplete) > 0:
-				dlg = CronDialog(None, tasks, incomplete)
-				dlg.ShowModal()
-				try:
-					dlg.complete_selected()
-				except Exception as exc:
-					dialogs.error("Error", f"There was an error marking your dailys as complete: {exc}")
-				dlg.Destroy()
-		tree = TaskTreeFrame(None)
+		# the user, their tasks and the theme sounds are all fetched at once, while the tree is already up showing the on-disk copy
+		startup = habitica.fetch_startup()
+		habitica.prefetch_sounds()
+		tree = TaskTreeFrame(None, cached_tasks=habitica.load_cached_tasks(), refresh=False)
 		app.app.SetTopWindow(tree)
 		tree.Show()
+		app.mark("tree shown")
+		wx.CallAfter(app.mark, "first paint")
+		utils.call_when_done(startup, on_startup_fetched, tree)
+		habitica.start_sync(tree.tasks_panel)
 	else:
 		print("Could not login")
 		app.exit()
 	app.app.MainLoop()
+
+
+def on_startup_fetched(future, tree):
+	"""Fill the tree with what fetch_startup got, and take care of cron if it's due"""
+	panel = tree.tasks_panel
+	try:
+		user, task_list = future.result()
+	except Exception as exc:
+		user, task_list = exc, exc
+	app.mark("user and tasks")
+	app.report_startup()
+	if isinstance(user, Exception) or not user:
+		dialogs.error(tree, "Error", f"Could not retrieve user information: {user}")
+		app.exit()
+		return
+	if isinstance(task_list, Exception):
+		dialogs.error(tree, "Error", f"Could not retrieve your tasks: {task_list}")
+		habitica.update_tasks(panel)
+		return
+	habitica.set_tag_names(user)
+	habitica.update_tasks(panel, tasks_dict=task_list)
+	if habitica.journal.pending():
+		# changes made while offline last time
+		habitica.flush_actions(panel)
+	if not user.needsCron:
+		return
+	incomplete = habitica.get_incomplete_dailies()
+	selected = []
+	if len(incomplete) > 0:
+		dlg = CronDialog(tree, task_list, incomplete)
+		dlg.ShowModal()
+		selected = dlg.get_selected()
+		dlg.Destroy()
+	# scoring and cron happen in the background, the tree stays usable meanwhile
+	utils.call_when_done(habitica.complete_dailies(selected), on_dailies_completed, tree)
+
+
+def on_dailies_completed(future, tree):
+	"""Report any dailies complete_dailies couldn't mark as done, then show the new day"""
+	try:
+		results, cron_response = future.result()
+	except Exception as exc:
+		dialogs.error(tree, "Error", f"There was an error marking your dailys as complete: {exc}")
+	else:
+		print(cron_response)  # todo: currently we're eating the notifications
+		failed = [task for task, result in results if not habitica.score_succeeded(result)]
+		if failed:
+			dialogs.error(tree, "Error", "The following dailys could not be marked as complete:\n" + "\n".join(str(task) for task in failed))
+	# cron starts a new day, so what we have is out of date
+	habitica.update_tasks(tree.tasks_panel)
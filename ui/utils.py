@@ -1,9 +1,34 @@
-import threading
-
-def run_threaded(func):
-	"""decorator to run a function in a separate thread"""
-	def wrapper(*args, **kwargs):
-		t=threading.Thread(target=func, args=args, daemon=True)
-		t.start()
-		return t
-	return wrapper
+import functools
+
+import wx
+
+from ui import trace
+from ui import workers
+
+
+def call_in_ui(func, *args, **kwargs):
+	"""Run func on the UI thread. The one place work is handed from background threads to wx"""
+	wx.CallAfter(trace.wrap(func, category="ui"), *args, **kwargs)
+
+def call_when_done(future, func, *args, **kwargs):
+	"""Run func(future, *args, **kwargs) on the UI thread once future is done"""
+	future.add_done_callback(lambda future: call_in_ui(func, future, *args, **kwargs))
+
+
+def run_threaded(func=None, kind=None, key=None):
+	"""decorator to run a function on the shared worker pool
+
+	Can be used bare or with arguments:
+		kind (str): Name of the job for metrics and cancellation, defaults to the function name.
+		key (callable): Called with the functions arguments, jobs returning the same key run one at a time.
+	The decorated function returns a concurrent.futures.Future.
+	"""
+	def decorator(func):
+		@functools.wraps(func)
+		def wrapper(*args, **kwargs):
+			job_key = key(*args, **kwargs) if key else None
+			return workers.pool.run(func, args, kwargs, kind=kind or func.__name__, key=job_key)
+		return wrapper
+	if func is not None:
+		return decorator(func)
+	return decorator
@@ -0,0 +1,95 @@
+"""Notices when the UI thread stops processing events, and logs what it was doing instead"""
+
+import logging
+import sys
+import threading
+import time
+import traceback
+
+
+log = logging.getLogger("watchdog")
+
+
+class Watchdog:
+	"""Posts a heartbeat to the UI thread and complains when it isn't handled in time.
+
+	When the event loop goes threshold seconds without running the heartbeat, the main threads stack is logged, so freezes seen by users can be traced to the code that caused them. Another line with the total duration is logged once it recovers.
+	"""
+
+	def __init__(self, threshold=0.5, interval=0.1, post=None):
+		"""args:
+			threshold (float): Seconds the UI thread may go without processing events before it counts as stalled.
+			interval (float): Seconds between checks.
+			post (callable): Called with a function to run it on the UI thread, wx.CallAfter by default.
+		"""
+		self.threshold = threshold
+		self.interval = interval
+		self.post = post
+		self.main_thread = threading.main_thread()
+		self.lock = threading.Lock()
+		self.stop_event = threading.Event()
+		self.thread = None
+		# monotonic time the heartbeat waiting on the UI thread was posted, None if there is none
+		self.posted = None
+		self.stalled = False
+		# (when, duration, stack) for every stall seen so far, newest last
+		self.stalls = []
+		self.max_stalls = 50
+
+	def start(self):
+		if self.thread:
+			return
+		if self.post is None:
+			import wx
+			self.post = wx.CallAfter
+		self.stop_event.clear()
+		self.thread = threading.Thread(target=self.run, name="watchdog", daemon=True)
+		self.thread.start()
+
+	def stop(self):
+		self.stop_event.set()
+		self.thread = None
+
+	def run(self):
+		while not self.stop_event.wait(self.interval):
+			with self.lock:
+				posted = self.posted
+				if posted is None:
+					self.posted = time.monotonic()
+			if posted is None:
+				try:
+					self.post(self.beat)
+				except Exception:
+					# the app is going away
+					return
+				continue
+			elapsed = time.monotonic() - posted
+			if elapsed < self.threshold or self.stalled:
+				continue
+			stack = self.main_stack()
+			with self.lock:
+				if self.posted != posted:
+					continue  # the heartbeat made it while we were looking
+				self.stalled = True
+				self.stalls.append((time.time(), None, stack))
+				del self.stalls[:-self.max_stalls]
+			log.warning(f"UI thread has not processed events for {elapsed:.2f} seconds, it is currently at:\n{stack}")
+
+	def beat(self):
+		"""Runs on the UI thread"""
+		with self.lock:
+			posted = self.posted
+			self.posted = None
+			stalled = self.stalled
+			self.stalled = False
+			if stalled and self.stalls:
+				when, _, stack = self.stalls[-1]
+				self.stalls[-1] = (when, time.monotonic() - posted, stack)
+		if stalled:
+			log.warning(f"UI thread recovered after {time.monotonic() - posted:.2f} seconds")
+
+	def main_stack(self):
+		frame = sys._current_frames().get(self.main_thread.ident)
+		if frame is None:
+			return "(main thread stack unavailable)"
+		return "".join(traceback.format_stack(frame))
@@ -0,0 +1,114 @@
+"""Shared, bounded pool of worker threads for everything that would otherwise block the UI"""
+
+import collections
+import concurrent.futures
+import logging
+import threading
+
+from ui import trace
+
+
+log = logging.getLogger("workers")
+
+
+class WorkerPool(concurrent.futures.Executor):
+	"""A fixed number of threads running named kinds of work.
+
+	Jobs sharing a key (e.g. a task id) run one after the other in submission order, everything else runs concurrently up to max_workers.
+	Also usable anywhere a regular concurrent.futures.Executor is expected.
+	"""
+
+	def __init__(self, max_workers=4):
+		self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="worker")
+		self.max_workers = max_workers
+		self.lock = threading.Lock()
+		self.queued = collections.Counter()
+		self.running = collections.Counter()
+		self.completed = collections.Counter()
+		# key -> jobs waiting for the one currently running under that key
+		self.key_queues = {}
+		self.futures = set()
+
+	def submit(self, fn, /, *args, **kwargs):
+		return self.run(fn, args, kwargs)
+
+	def run(self, fn, args=(), kwargs=None, kind="default", key=None):
+		"""Schedule fn(*args, **kwargs) and return a concurrent.futures.Future for its result.
+
+		args:
+			kind (str): Name used for metrics and bulk cancellation, e.g. "score" or "refresh".
+			key (hashable): Jobs with the same key never overlap, later ones wait for earlier ones to finish.
+		"""
+		future = concurrent.futures.Future()
+		future.kind = kind
+		future.key = key
+		job = (future, trace.wrap(fn, category=kind), args, kwargs or {})
+		with self.lock:
+			self.queued[kind] += 1
+			self.futures.add(future)
+			if key is not None:
+				if key in self.key_queues:
+					self.key_queues[key].append(job)
+					return future
+				self.key_queues[key] = collections.deque()
+		self.executor.submit(self._execute, job)
+		return future
+
+	def _execute(self, job):
+		future, fn, args, kwargs = job
+		kind = future.kind
+		with self.lock:
+			self.queued[kind] -= 1
+		if future.set_running_or_notify_cancel():
+			with self.lock:
+				self.running[kind] += 1
+			try:
+				future.set_result(fn(*args, **kwargs))
+			except BaseException as exc:
+				log.exception(f"While running a {kind} job")
+				future.set_exception(exc)
+			finally:
+				with self.lock:
+					self.running[kind] -= 1
+					self.completed[kind] += 1
+		with self.lock:
+			self.futures.discard(future)
+			next_job = None
+			if future.key is not None:
+				waiting = self.key_queues[future.key]
+				if waiting:
+					next_job = waiting.popleft()
+				else:
+					del self.key_queues[future.key]
+		if next_job:
+			self.executor.submit(self._execute, next_job)
+
+	def cancel(self, kind=None, key=None):
+		"""Cancel every job that hasn't started yet, optionally only those of a given kind and/or key. Returns how many were cancelled"""
+		with self.lock:
+			futures = [f for f in self.futures if (kind is None or f.kind == kind) and (key is None or f.key == key)]
+		return sum(1 for f in futures if f.cancel())
+
+	def metrics(self):
+		"""Queue depth and activity, both overall and per kind"""
+		with self.lock:
+			kinds = set(self.queued) | set(self.running) | set(self.completed)
+			by_kind = {
+				kind: {"queued": self.queued[kind], "running": self.running[kind], "completed": self.completed[kind]}
+				for kind in kinds
+			}
+			return {
+				"max_workers": self.max_workers,
+				"queued": sum(self.queued.values()),
+				"running": sum(self.running.values()),
+				"serialized_keys": len(self.key_queues),
+				"kinds": by_kind,
+			}
+
+	def shutdown(self, wait=True, *, cancel_futures=False):
+		if cancel_futures:
+			self.cancel()
+		self.executor.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+
+pool = WorkerPool()